@@ -1,63 +1,65 @@
 #!/usr/bin/python
 """
 Convolution plugin for GIMP
+Kernels and engines live in convolution_core.py, this module connects them to GIMP drawables and dialog.
 Author: Yahor Byaliauski
 """
 
-import math
-import array
-import sys
 import os
 import random
+import multiprocessing
+import collections
+import threading
+import glob
+import time
+from multiprocessing.pool import ThreadPool
 import gimp
 import gimpplugin
 import gtk
+import gobject
 import gimpui
 import gimpcolor
 import pango
 from gimpenums import *
 from gimpshelf import shelf
 from gimpfu import *
+from convolution_core import ConvolutionCore, ProgressReporter
 
 pdb = gimp.pdb
 
-class ConvolutionPlugin(gimpplugin.plugin):
+
+class ConvolutionPlugin(gimpplugin.plugin, ConvolutionCore):
     """
     Main class of the plugin, that takes care of edge detection.
-    Contains some mandatory methods for GIMP and some helper methods for edge detection.
+    Contains some mandatory methods for GIMP, edge detection itself is inherited from ConvolutionCore.
     """
     SHELF_KEY = 'CONVOLUTION'  # Shelf is used for saving specified values between plugin runs
     DEFAULT_SETTINGS = {
         ('KERNEL', 'Sobel'),
-        ('DISPLAY', 0)
+        ('DISPLAY', 0),
+        ('WORKERS', 0),
+        ('LUMA', 'Average'),
+        ('KERNEL_SPEC', ''),
+        ('CACHE', 0),
+        ('EDGE_BLUR', 1),
+        ('EDGE_LOW', 40),
+        ('EDGE_HIGH', 100),
+        ('MAGNITUDE', 'Exact')
     }
+    PREVIEW_CACHE_LIMIT = 64 * 1024 * 1024  # Maximum size of cached preview buffers in bytes
+    LAYER_WORKERS = 2  # Layers computed at the same time by convolution_layers
 
     def __init__(self):
         """
         Constructor that declares empty values to use across class methods.
         """
+        ConvolutionCore.__init__(self)
+        self.directory = gimp.directory  # Results are cached inside of GIMP directory
         self.image = None
         self.drawable = None
         self.settings = None
         self.display_type = 0
         self.kernel_type = 'Sobel'
-        self.kernels_x = {'Sobel': [[1, 0, -1],
-                                    [2, 0, -2],
-                                    [1, 0, -1]],
-                          'Roberts': [[1, 0],
-                                      [0, -1]],
-                          'Prewitt': [[-1, 0, 1],
-                                      [-1, 0, 1],
-                                      [-1, 0, 1]]}
-        self.kernels_y = {'Sobel': [[1, 2, 1],
-                                    [0, 0, 0],
-                                    [-1, -2, -1]],
-                          'Roberts': [[0, 1],
-                                      [-1, 0]],
-                          'Prewitt': [[-1, -1, -1],
-                                      [0, 0, 0],
-                                      [1, 1, 1]]}
-        self.progress = 0.0
 
         # Dialog options
         self.spacing = 1
@@ -80,14 +82,39 @@ class ConvolutionPlugin(gimpplugin.plugin):
         self.color_select = None
         self.color_buttons = None
 
+        # Dialog options for grayscale weights selection
+        self.luma_buttons = None
+
+        # Dialog options for magnitude selection
+        self.magnitude_buttons = None
+
+        # Dialog option for on-disk cache of results
+        self.cache_button = None
 
         self.preview = None
+        self.preview_cache = collections.OrderedDict()  # Rendered previews in least recently used order
+        self.preview_cache_size = 0
+        self.preview_geometry = None
+        self.preview_generation = 0  # Increased with every preview request, older computations stop
+        self.preview_threads = []  # Threads computing previews, that may not have stopped yet
 
         self.label = None
 
         self.ok_button = None
         self.cancel_button = None
 
+    def tile_size(self):
+        """
+        Returns width and height of GIMP tiles.
+        """
+        return gimp.tile_width(), gimp.tile_height()
+
+    def progress_update(self, progress):
+        """
+        Shows progress in GIMP progress bar.
+        """
+        gimp.progress_update(progress)
+
     def start(self):
         """
         Standard method of GIMP plugin that is called at the beginning.
@@ -127,39 +154,150 @@ class ConvolutionPlugin(gimpplugin.plugin):
                 (PDB_DRAWABLE, "drawable", "Input drawable"),
                 (PDB_STRING, "p_kernel_type", "Type of active kernel for edge detection"),
                 (PDB_INT32, "p_display_type", "Type of edge representation"),
+                (PDB_INT32, "p_workers", "Number of worker threads (0 uses all CPUs)"),
+                (PDB_STRING, "p_luma_type", "Weights of grayscale conversion (Average, Rec601, Rec709)"),
+                (PDB_STRING, "p_kernel_spec", "Custom kernel used with p_kernel_type 'Custom', "
+                                              "rows separated by ';' and X and Y kernels by '|'"),
+                (PDB_INT32, "p_cache", "Cache results on disk and reuse them for unchanged drawables (0, 1)"),
+                (PDB_INT32, "p_edge_blur", "Radius of blur before gradient with display type 2 (0 turns it off)"),
+                (PDB_INT32, "p_edge_low", "Gradient magnitude of weak edges with display type 2"),
+                (PDB_INT32, "p_edge_high", "Gradient magnitude of strong edges with display type 2"),
+                (PDB_STRING, "p_magnitude_type", "Magnitude with display type 0 (Exact, L1, Alpha max beta min)"),
+            ],
+            []
+        )
+        gimp.install_procedure(
+            "convolution_batch",
+            "Convolution for edge detection of all images matching given pattern.",
+            "byaliyah@fit.cvut.cz",
+            "Yahor Byaliauski",
+            "Yahor Byaliauski",
+            "2024",
+            None,
+            "",
+            PLUGIN,
+            [   (PDB_INT32, "run_mode", "Run mode"),
+                (PDB_STRING, "p_input_glob", "Pattern of input image files"),
+                (PDB_STRING, "p_output_dir", "Directory for output images"),
+                (PDB_STRING, "p_kernel_type", "Type of active kernel for edge detection"),
+                (PDB_INT32, "p_display_type", "Type of edge representation"),
+            ],
+            []
+        )
+        gimp.install_procedure(
+            "convolution_layers",
+            "Convolution for edge detection of all layers or a range of layers (animation frames) of the image.",
+            "byaliyah@fit.cvut.cz",
+            "Yahor Byaliauski",
+            "Yahor Byaliauski",
+            "2024",
+            None,
+            "RGB*, GRAY*",
+            PLUGIN,
+            [   (PDB_INT32, "run_mode", "Run mode"),
+                (PDB_IMAGE, "image", "Input image"),
+                (PDB_STRING, "p_kernel_type", "Type of active kernel for edge detection"),
+                (PDB_INT32, "p_display_type", "Type of edge representation"),
+                (PDB_INT32, "p_first_layer", "Index of the first layer, 0 is the top one"),
+                (PDB_INT32, "p_last_layer", "Index of the last layer (inclusive), -1 is the bottom one"),
             ],
             []
         )
-
-    def clamp_color_value(self, value):
-        """
-        Limits color value from 0 to 255.
-        """
-        return max(min(255, value), 0)
 
     def update_preview(self, force):
         """
         Method that handles preview image updating if changes are made or is forced
         """
         if force or self.preview.get_update():
-            self.convolute(self.kernel_type, self.display_type, True)
+            self.preview_generation += 1  # Cancels computation of older preview
+            key = self.preview_cache_key(self.kernel_type, self.display_type)
+            if key in self.preview_cache:  # Already rendered, draw it without computing
+                pixels, rowstride = self.preview_cache.pop(key)
+                self.preview_cache[key] = (pixels, rowstride)  # Mark as recently used
+                self.preview.draw_buffer(pixels, rowstride)
+                return
+            src_pixels, width, height, bpp = self.preview.get_source()  # Only visible part at display resolution
+            worker = threading.Thread(target=self.render_preview,
+                                      args=(self.preview_generation, key, self.kernel_type, self.display_type,
+                                            src_pixels, width, height, bpp, self.preview_scale()))
+            worker.daemon = True
+            worker.start()
+            self.preview_threads = [thread for thread in self.preview_threads if thread.is_alive()] + [worker]
+
+    def render_preview(self, generation, key, kernel_name, color_mode, src_pixels, width, height, bpp, scale):
+        """
+        Computes preview in background thread, so the dialog stays responsive.
+        Computation stops, when newer preview is requested.
+        """
+        def cancelled():
+            return generation != self.preview_generation
+        reporter = ProgressReporter(cancelled=cancelled)  # Progress bar can not be updated from this thread
+        dst_pixels = self.compute_preview(kernel_name, color_mode, src_pixels, width, height, bpp, reporter, scale)
+        if dst_pixels is not None:
+            gobject.idle_add(self.finish_preview, generation, key, dst_pixels, width * bpp)
+
+    def finish_preview(self, generation, key, pixels, rowstride):
+        """
+        Draws preview computed in background thread. Called from GTK main loop.
+        """
+        if generation == self.preview_generation:
+            self.preview.draw_buffer(pixels, rowstride)
+            self.preview_cache_store(key, pixels, rowstride)
+        return False  # Remove callback from GTK main loop
+
+    def preview_scale(self):
+        """
+        Returns how many preview pixels show one drawable pixel, when preview is zoomed in.
+        """
+        return max(1, int(self.preview.get_factor()))
+
+    def preview_cache_key(self, kernel_name, color_mode):
+        """
+        Returns key of preview cache for given values and current preview viewport.
+        Cache is cleared, if the viewport (position, size or zoom) has changed.
+        """
+        geometry = (self.preview.get_position(), self.preview.get_size(), self.preview.get_factor())
+        if geometry != self.preview_geometry:
+            self.preview_cache.clear()
+            self.preview_cache_size = 0
+            self.preview_geometry = geometry
+        return (kernel_name, color_mode, self.luma_type, self.magnitude_type,
+                (self.edge_blur, self.edge_low, self.edge_high), geometry)
+
+    def preview_cache_store(self, key, pixels, rowstride):
+        """
+        Saves rendered preview and removes least recently used ones above the size limit.
+        """
+        if len(pixels) > self.PREVIEW_CACHE_LIMIT:
+            return
+        if key in self.preview_cache:
+            self.preview_cache_size -= len(self.preview_cache.pop(key)[0])
+        self.preview_cache[key] = (pixels, rowstride)
+        self.preview_cache_size += len(pixels)
+        while self.preview_cache_size > self.PREVIEW_CACHE_LIMIT:
+            old_pixels = self.preview_cache.popitem(last=False)[1][0]
+            self.preview_cache_size -= len(old_pixels)
 
     def label_show_selection(self):
         """
         Method that handles updating selected parameters in the dialogue window
         """
         switcher = {0: "Grayscale",
-                    1: "Red and blue"}
+                    1: "Red and blue",
+                    2: "Thin edges"}
         display_type_text = switcher.get(self.display_type, "None")
         self.label.set_text("Selected values\n" +
                             "\nKernel: " + str(self.kernel_type) +
-                            "\nRepresentation: " + display_type_text
+                            "\nRepresentation: " + display_type_text +
+                            "\nGrayscale: " + str(self.luma_type) +
+                            "\nMagnitude: " + str(self.magnitude_type)
                             )
 
     def create_dialog(self):
         """
         Method that creates widgets for dialogue
         """
+        gobject.threads_init()  # Preview is computed in background threads
         # Dialog initialization
         self.dialog = gimpui.Dialog('Detect edges', 'convolution_dialog',
                                     flags=gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT)
@@ -203,7 +341,7 @@ class ConvolutionPlugin(gimpplugin.plugin):
         self.table.attach(color_label, 0, 3, len(self.kernels_x.keys()) + 1,
                           len(self.kernels_x.keys()) + 2, xpadding=5, ypadding=2)
         self.color_buttons = []
-        color_types = [("Grayscale", 0), ("Red and blue", 1)]
+        color_types = [("Grayscale", 0), ("Red and blue", 1), ("Thin edges", 2)]
         color_group = None
         for index, (label, value) in enumerate(color_types):
             button = gtk.RadioButton(color_group, label)
@@ -219,6 +357,57 @@ class ConvolutionPlugin(gimpplugin.plugin):
                               len(self.kernels_x.keys()) + 3 + index,
                               gtk.FILL, gtk.FILL, xpadding=10, ypadding=1)
 
+        luma_row = len(self.kernels_x.keys()) + len(color_types) + 2
+        luma_label = gtk.Label()
+        luma_label.set_markup('<b>Grayscale Weights</b>')
+        luma_label.set_alignment(0, 0.5)
+        luma_label.show()
+        self.table.attach(luma_label, 0, 3, luma_row, luma_row + 1, xpadding=5, ypadding=2)
+        self.luma_buttons = []
+        luma_group = None
+        for index, name in enumerate(sorted(self.LUMA_WEIGHTS.keys())):
+            button = gtk.RadioButton(luma_group, name)
+            button.connect("toggled", self.on_luma_radio_toggled, name)
+            button.show()
+            self.luma_buttons.append(button)
+            luma_group = button if index == 0 else luma_group
+            alignment = gtk.Alignment(0, 0.5, 0, 0)
+            alignment.add(button)
+            alignment.show()
+
+            self.table.attach(alignment, 0, 3, luma_row + 1 + index, luma_row + 2 + index,
+                              gtk.FILL, gtk.FILL, xpadding=10, ypadding=1)
+
+        magnitude_row = luma_row + len(self.LUMA_WEIGHTS) + 1
+        magnitude_label = gtk.Label()
+        magnitude_label.set_markup('<b>Magnitude</b>')
+        magnitude_label.set_alignment(0, 0.5)
+        magnitude_label.show()
+        self.table.attach(magnitude_label, 0, 3, magnitude_row, magnitude_row + 1, xpadding=5, ypadding=2)
+        self.magnitude_buttons = []
+        magnitude_group = None
+        for index, name in enumerate(self.MAGNITUDE_TYPES):
+            button = gtk.RadioButton(magnitude_group, name)
+            button.connect("toggled", self.on_magnitude_radio_toggled, name)
+            button.show()
+            self.magnitude_buttons.append(button)
+            magnitude_group = button if index == 0 else magnitude_group
+            alignment = gtk.Alignment(0, 0.5, 0, 0)
+            alignment.add(button)
+            alignment.show()
+
+            self.table.attach(alignment, 0, 3, magnitude_row + 1 + index, magnitude_row + 2 + index,
+                              gtk.FILL, gtk.FILL, xpadding=10, ypadding=1)
+
+        cache_row = magnitude_row + len(self.MAGNITUDE_TYPES) + 1
+        self.cache_button = gtk.CheckButton('Cache results on disk')
+        self.cache_button.set_active(bool(self.settings.get('CACHE', 0)))
+        self.cache_button.show()
+        alignment = gtk.Alignment(0, 0.5, 0, 0)
+        alignment.add(self.cache_button)
+        alignment.show()
+        self.table.attach(alignment, 0, 3, cache_row, cache_row + 1, gtk.FILL, gtk.FILL, xpadding=5, ypadding=2)
+
         # Preview
         self.preview = gimpui.ZoomPreview(self.drawable)
         self.preview.set_update(True)
@@ -261,6 +450,24 @@ class ConvolutionPlugin(gimpplugin.plugin):
             self.update_preview(None)
             # Update selected color
 
+    def on_luma_radio_toggled(self, button, luma_name):
+        """
+        Callback method for grayscale weights radio button event
+        """
+        if button.get_active():
+            self.luma_type = luma_name
+            self.label_show_selection()
+            self.update_preview(None)
+
+    def on_magnitude_radio_toggled(self, button, magnitude_name):
+        """
+        Callback method for magnitude radio button event
+        """
+        if button.get_active():
+            self.magnitude_type = magnitude_name
+            self.label_show_selection()
+            self.update_preview(None)
+
     def show_dialog(self):
         """
         Show created dialog.
@@ -268,10 +475,17 @@ class ConvolutionPlugin(gimpplugin.plugin):
         """
         if self.dialog is None:
             self.create_dialog()
-        return self.dialog.run()
+        result = self.dialog.run()
+        self.preview_generation += 1  # Stop unfinished preview computation
+        for worker in self.preview_threads:  # Wait for them, so they do not compete with the final run or its timings
+            worker.join()
+        self.preview_threads = []
+        return result
 
     def convolution_main(self, run_mode, image, drawable,
-                         p_kernel_type='Sobel', p_display_type='0'):
+                         p_kernel_type='Sobel', p_display_type='0', p_workers=0,
+                         p_luma_type='Average', p_kernel_spec='', p_cache=0,
+                         p_edge_blur=1, p_edge_low=40, p_edge_high=100, p_magnitude_type='Exact'):
         """
         Main method, that cares about run modes and calling computing convolution method.
         """
@@ -288,30 +502,211 @@ class ConvolutionPlugin(gimpplugin.plugin):
             self.settings = dict(self.DEFAULT_SETTINGS)
             shelf[self.SHELF_KEY] = self.settings
 
+        if run_mode == RUN_NONINTERACTIVE:
+            if p_edge_blur < 0:
+                raise ValueError("Blur radius must not be negative")
+            if p_luma_type not in self.LUMA_WEIGHTS:
+                raise ValueError("Unknown grayscale weights %r, use one of: %s"
+                                 % (p_luma_type, ", ".join(sorted(self.LUMA_WEIGHTS))))
+            if p_magnitude_type not in self.MAGNITUDE_TYPES:
+                raise ValueError("Unknown magnitude %r, use one of: %s"
+                                 % (p_magnitude_type, ", ".join(self.MAGNITUDE_TYPES)))
+            self.settings['KERNEL_SPEC'] = p_kernel_spec
+            self.settings['EDGE_BLUR'] = p_edge_blur
+            self.settings['EDGE_LOW'] = p_edge_low
+            self.settings['EDGE_HIGH'] = p_edge_high
+        if self.settings.get('KERNEL_SPEC'):  # Custom kernel is available in all run modes
+            self.register_kernel('Custom', *self.parse_kernel_spec(self.settings['KERNEL_SPEC']))
+        self.edge_blur = self.settings.get('EDGE_BLUR', 1)  # Thresholds are needed by preview too
+        self.edge_low = self.settings.get('EDGE_LOW', 40)
+        self.edge_high = self.settings.get('EDGE_HIGH', 100)
+
         if run_mode == RUN_INTERACTIVE:  # Interactive mod with UI
             result = self.show_dialog()
             print("m_convolution_main - Dialog shown")
             if result != gtk.RESPONSE_OK:
                 return
+            self.workers = self.settings.get('WORKERS', 0)
+            self.cache = self.cache_button.get_active()
             self.settings['KERNEL'] = self.kernel_type
             self.settings['DISPLAY'] = self.display_type
+            self.settings['LUMA'] = self.luma_type
+            self.settings['MAGNITUDE'] = self.magnitude_type
+            self.settings['CACHE'] = int(self.cache)
             shelf[self.SHELF_KEY] = self.settings
 
         elif run_mode == RUN_NONINTERACTIVE:  # Non-interactive mode. Used by console.
             self.kernel_type = p_kernel_type
             self.display_type = p_display_type
+            self.workers = p_workers
+            self.luma_type = p_luma_type
+            self.magnitude_type = p_magnitude_type
+            self.cache = bool(p_cache)
             self.settings['KERNEL'] = self.kernel_type
             self.settings['DISPLAY'] = self.display_type
+            self.settings['WORKERS'] = self.workers
+            self.settings['LUMA'] = self.luma_type
+            self.settings['MAGNITUDE'] = self.magnitude_type
+            self.settings['CACHE'] = int(self.cache)
+            shelf[self.SHELF_KEY] = self.settings  # Shelf returns a copy, changes must be saved back
 
         elif run_mode == RUN_WITH_LAST_VALS:  # Run with last values.
             self.kernel_type = self.settings['KERNEL']
             self.display_type = self.settings['DISPLAY']
+            self.workers = self.settings.get('WORKERS', 0)
+            self.luma_type = self.settings.get('LUMA', 'Average')
+            self.magnitude_type = self.settings.get('MAGNITUDE', 'Exact')
+            self.cache = bool(self.settings.get('CACHE', 0))
 
         gimp.pdb.gimp_image_undo_group_start(self.image)  # Handling undo groups in GIMP (for CTRL + Z)
-        self.convolute(self.kernel_type, self.display_type, False)  # Start convolution
+        self.convolute(self.kernel_type, self.display_type)  # Start convolution
         gimp.pdb.gimp_image_undo_group_end(self.image)
 
-    def convolute(self, kernel_name, color_mode, preview):
+    def convolution_batch(self, run_mode, p_input_glob, p_output_dir, p_kernel_type='Sobel', p_display_type=0):
+        """
+        Batch method, that detects edges in all images matching the pattern and saves them to output directory.
+        Next image is loaded and previous one is saved, while edges of current image are computed.
+        """
+        print("m_convolution_batch")
+
+        paths = sorted(glob.glob(p_input_glob))
+        if not os.path.isdir(p_output_dir):
+            os.makedirs(p_output_dir)
+
+        gimp.progress_init('Detecting edges (batch)...')
+        reporter = self.progress_reporter()
+        reporter.set(0.0)
+        start_time = time.time()
+        compute_pool = ThreadPool(1)  # Computation of one image overlaps loading and saving of the others
+        pending = None
+        try:
+            for index, path in enumerate(paths):
+                image, drawable, src_pixels = self.load_batch_image(path)
+                result = compute_pool.apply_async(self.compute_pixels,
+                                                  (p_kernel_type, p_display_type, src_pixels,
+                                                   drawable.width, drawable.height, drawable.bpp))
+                del src_pixels
+                if pending is not None:
+                    self.save_batch_image(p_output_dir, *pending)
+                    reporter.set(float(index) / len(paths))
+                pending = (path, image, drawable, result)
+            if pending is not None:
+                self.save_batch_image(p_output_dir, *pending)
+        finally:
+            compute_pool.terminate()
+            compute_pool.join()
+        reporter.finish()
+
+        elapsed = time.time() - start_time
+        print("m_convolution_batch - %d images in %.2f s (%.2f images/s)"
+              % (len(paths), elapsed, len(paths) / elapsed if elapsed > 0 else 0.0))
+
+    def convolution_layers(self, run_mode, image, p_kernel_type='Sobel', p_display_type=0,
+                           p_first_layer=0, p_last_layer=-1):
+        """
+        Layers method, that detects edges in all layers or a range of layers of the image (e.g. frames of animation).
+        Layers are computed concurrently, while the others are read and written, all in one undo group
+        with one progress bar. Display is flushed only once at the end.
+        """
+        print("m_convolution_layers")
+
+        self.image = image
+        layers = self.layer_range(image, p_first_layer, p_last_layer)
+        area = float(sum(layer.width * layer.height for layer in layers)) or 1.0
+        done = 0
+
+        gimp.progress_init('Detecting edges (layers)...')
+        reporter = self.progress_reporter()
+        reporter.set(0.0)
+        start_time = time.time()
+        pdb.gimp_image_undo_group_start(image)  # One undo step for all layers
+        compute_pool = ThreadPool(self.LAYER_WORKERS)
+        pending = collections.deque()
+        try:
+            for layer in layers:
+                src_rgn = layer.get_pixel_rgn(0, 0, layer.width, layer.height, False, False)
+                src_pixels = src_rgn[0:layer.width, 0:layer.height]
+                result = compute_pool.apply_async(self.compute_pixels,
+                                                  (p_kernel_type, p_display_type, src_pixels,
+                                                   layer.width, layer.height, layer.bpp))
+                del src_pixels
+                pending.append((layer, result))
+                if len(pending) > self.LAYER_WORKERS:  # Limit number of layers held in memory
+                    done += self.write_layer(*pending.popleft())
+                    reporter.set(done / area)
+            while pending:
+                done += self.write_layer(*pending.popleft())
+                reporter.set(done / area)
+        finally:
+            compute_pool.terminate()
+            compute_pool.join()
+            pdb.gimp_image_undo_group_end(image)
+        reporter.finish()
+        gimp.displays_flush()  # Update GUI once for all layers
+
+        elapsed = time.time() - start_time
+        print("m_convolution_layers - %d layers in %.2f s (%.2f layers/s)"
+              % (len(layers), elapsed, len(layers) / elapsed if elapsed > 0 else 0.0))
+
+    def layer_range(self, image, first, last):
+        """
+        Returns layers of the image from first to last (inclusive), negative indexes count from the bottom.
+        Layer groups are skipped, they have no pixels of their own.
+        """
+        layers = image.layers
+        first = first + len(layers) if first < 0 else first
+        last = last + len(layers) if last < 0 else last
+        return [layer for layer in layers[first:last + 1] if not pdb.gimp_item_is_group(layer)]
+
+    def write_layer(self, layer, result):
+        """
+        Waits for computed edges and writes them into the layer through its shadow tiles.
+        Returns number of written pixels.
+        """
+        dst_rgn = layer.get_pixel_rgn(0, 0, layer.width, layer.height, True, True)
+        dst_rgn[0:layer.width, 0:layer.height] = bytes(result.get())  # Pixel regions accept only strings
+        layer.flush()
+        layer.merge_shadow(True)
+        layer.update(0, 0, layer.width, layer.height)
+        return layer.width * layer.height
+
+    def load_batch_image(self, path):
+        """
+        Loads image for batch processing without undo recording and reads its pixels.
+        """
+        image = pdb.gimp_file_load(path, path)
+        pdb.gimp_image_undo_disable(image)  # Batch results are saved, undo is not needed
+        drawable = pdb.gimp_image_get_active_drawable(image)
+        src_rgn = drawable.get_pixel_rgn(0, 0, drawable.width, drawable.height, False, False)
+        return image, drawable, src_rgn[0:drawable.width, 0:drawable.height]
+
+    def save_batch_image(self, output_dir, path, image, drawable, result):
+        """
+        Waits for computed edges, writes them into the drawable and saves the image.
+        """
+        dst_rgn = drawable.get_pixel_rgn(0, 0, drawable.width, drawable.height, True, True)
+        dst_rgn[0:drawable.width, 0:drawable.height] = bytes(result.get())  # Pixel regions accept only strings
+        drawable.flush()
+        drawable.merge_shadow(False)
+        output_path = os.path.join(output_dir, os.path.basename(path))
+        pdb.gimp_file_save(image, drawable, output_path, output_path)
+        pdb.gimp_image_delete(image)
+
+    def selection_reader(self, x1, y1, width, height):
+        """
+        Returns read_mask(start, end) callback, that reads rows of the selection mask under the region,
+        or None when nothing is selected and whole region is processed.
+        Partially selected pixels are blended by GIMP, when shadow tiles are merged through the selection.
+        """
+        if self.image is None or pdb.gimp_selection_is_empty(self.image):
+            return None
+        offset_x, offset_y = self.drawable.offsets  # Selection uses image coordinates
+        mask_rgn = self.image.selection.get_pixel_rgn(x1 + offset_x, y1 + offset_y, width, height, False, False)
+        def read_mask(start, end):
+            return mask_rgn[x1 + offset_x:x1 + offset_x + width, y1 + offset_y + start:y1 + offset_y + end]
+        return read_mask
+
+    def convolute(self, kernel_name, color_mode):
         """
         Main method, that computes edges and draws them in the selected layer.
         """
@@ -320,83 +715,63 @@ class ConvolutionPlugin(gimpplugin.plugin):
         # Declaring basic variables.
         kernel_x = self.kernels_x[kernel_name]
         kernel_y = self.kernels_y[kernel_name]
-        x1 = y1 = x2 = y2 = 0
-        step = len(kernel_x[0])
-
-        # Starting sequence for preview option
-        if preview:
-            gimp.progress_init('Detecting edges (preview)...') # Initialize progress bar
-            src_pixels, width, height, bpp = self.preview.get_source()
-            src_pixels = array.array('B', src_pixels)
-            gimp.progress_update(0.0)
-
-            dst_rgn = self.drawable.get_pixel_rgn(0, 0, width, height, False, False)
-            dst_pixels = array.array('B', dst_rgn[0:width, 0:height])
-        else:
-            gimp.progress_init('Detecting edges...')  # Initialize progress bar
-            gimp.progress_update(0.0)
 
-            (x1, y1, x2, y2) = self.drawable.mask_bounds
-            width = x2 - x1
-            height = y2 - y1
-            bpp = self.drawable.bpp
-
-            src_rgn = self.drawable.get_pixel_rgn(x1, y1, width, height, False, False)
-            src_pixels = array.array('B', src_rgn[x1:x2, y1:y2])  # Convert bytearray to unsigned char array
-
-            dst_rgn = self.drawable.get_pixel_rgn(0, 0, width, height, True, True)
-            dst_pixels = array.array('B', dst_rgn[0:width, 0:height])  # Convert bytearray to unsigned char array
+        reporter = self.progress_reporter()  # Progress bar is updated at most PROGRESS_RATE times per second
+        gimp.progress_init('Detecting edges...')  # Initialize progress bar
+        reporter.set(0.0)
+        self.timing_start()
+
+        (x1, y1, x2, y2) = self.drawable.mask_bounds
+        width = x2 - x1
+        height = y2 - y1
+        bpp = self.drawable.bpp
+
+        src_rgn = self.drawable.get_pixel_rgn(x1, y1, width, height, False, False)
+        dst_rgn = self.drawable.get_pixel_rgn(x1, y1, width, height, True, True)
+
+        def read(x_start, x_end, y_start, y_end):
+            return src_rgn[x1 + x_start:x1 + x_end, y1 + y_start:y1 + y_end]
+        def write(x_start, x_end, y_start, y_end, pixels):
+            dst_rgn[x1 + x_start:x1 + x_end, y1 + y_start:y1 + y_end] = pixels  # Write block into the shadow tiles
+        bands = self.split_bands(y1, height)
+        read_mask = self.selection_reader(x1, y1, width, height)
+        if read_mask is None:
+            blocks = [(0, width, start, end) for start, end in bands]
+        else:
+            blocks = self.split_selected(read_mask, x1, width, bands)
 
         print("m_convolute - Loop started")
-        # Traverse every pixel in picture
-        for pos_y in range(0, height):
-            for pos_x in range(0, width):
-                center_pos = (pos_x + width * pos_y) * bpp
-                center_pixel = src_pixels[center_pos:(center_pos + bpp)]
-                center_sum_x = 0
-                center_sum_y = 0
-                # Cycle through surrounding pixels
-                for y in range(0, step):
-                    for x in range(0, step):
-                        selected_x = pos_x - (step / 2) + x
-                        selected_y = pos_y - (step / 2) + y
-                        if selected_x < 0 or selected_x >= width:  # Mirror padding
-                            selected_x = width - abs(selected_x)
-                        if selected_y < 0 or selected_y >= height: # Mirror padding
-                            selected_y = height - abs(selected_y)
-                        selected_pos = (selected_x + width * selected_y) * bpp
-                        selected_pixel = src_pixels[selected_pos:(selected_pos + bpp)]
-                        grayscale_value = 0
-                        for i in range(0, 3):
-                            grayscale_value += selected_pixel[i]
-                        grayscale_value /= 3  # Get average of RGB values
-                        center_sum_x += grayscale_value * kernel_x[x][y]  # Multiply by x kernel
-                        center_sum_y += grayscale_value * kernel_y[x][y]  # Multiply by y kernel
-                    if color_mode == 1:
-                        center_pixel[0] = self.clamp_color_value(center_sum_x)
-                        center_pixel[1] = self.clamp_color_value(center_sum_y / 2)
-                        center_pixel[2] = self.clamp_color_value(center_sum_y)
-                    else:
-                        center_pixel[0] = center_pixel[1] = center_pixel[2] = (self.clamp_color_value
-                                                                               (int(math.sqrt(center_sum_x ** 2 + center_sum_y ** 2))))
-                    dst_pixels[center_pos:(center_pos + bpp)] = center_pixel
-            # Update progress bar
-            self.progress = float(pos_y + 1) / height
-            gimp.progress_update(self.progress)
-        print("m_convolute - Loop completed")
-        self.progress = 1.0
-        gimp.progress_update(self.progress)
-        if preview:
-            dst_pixels = bytearray(dst_pixels)
-            self.preview.draw_buffer(str(dst_pixels), width * bpp)
+        if self.cache:
+            start = self.clock()
+            key = self.cache_key(read, read_mask, width, height, bpp, kernel_x, kernel_y, color_mode, bands)
+            hit = self.cache_load(key, write, bpp)
+            self.record('cache', start)
+            hits, misses = self.cache_count(hit)
+            print("m_convolute - Cache %s (hits: %d, misses: %d)" % ('hit' if hit else 'miss', hits, misses))
+            if not hit:
+                cache_write, close = self.cache_writer(key, write)
+                completed = False
+                try:
+                    completed = self.convolute_blocks(read, cache_write, width, height, bpp, kernel_x, kernel_y,
+                                                      color_mode, blocks, reporter)
+                finally:
+                    close(completed)
         else:
-            dst_rgn[0:width, 0:height] = dst_pixels.tostring()
-            self.drawable.flush()
-            self.drawable.merge_shadow(True)  # Take effect, if drawing on the shadow tiles
-            self.drawable.update(x1, y1, width, height)
-            gimp.displays_flush()  # Update GUI to show changes
+            self.convolute_blocks(read, write, width, height, bpp, kernel_x, kernel_y, color_mode, blocks, reporter)
+        print("m_convolute - Loop completed")
+        reporter.finish()
+        start = self.clock()
+        self.drawable.flush()
+        self.drawable.merge_shadow(True)  # Take effect, if drawing on the shadow tiles
+        self.drawable.update(x1, y1, width, height)
+        self.record('merge', start)
+        start = self.clock()
+        gimp.displays_flush()  # Update GUI to show changes
+        self.record('flush', start)
+        self.timing_finish({'kernel': kernel_name, 'display': color_mode, 'width': width, 'height': height,
+                            'bpp': bpp, 'workers': self.workers or multiprocessing.cpu_count(),
+                            'cache': self.cache})
         print("m_convolute - Operations applied")
 
-
 if __name__ == '__main__':
     ConvolutionPlugin().start()
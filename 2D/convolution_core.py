@@ -0,0 +1,1630 @@
+#!/usr/bin/python
+"""
+Convolution core for edge detection
+Kernels and engines of the GIMP plug-in without GIMP and GTK, so they can be imported and run from command line:
+python convolution_core.py input.png output.png --kernel Sobel
+Author: Yahor Byaliauski
+"""
+
+import math
+import array
+import sys
+import os
+import struct
+import zlib
+import hashlib
+import time
+import threading
+import collections
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+numpy = None  # Imported on first use by load_numpy, it takes longer than the rest of the module
+numpy_loaded = False
+
+process_time = getattr(time, 'process_time', None) or time.clock  # CPU time of the process
+thread_time = getattr(time, 'thread_time', None) or process_time  # CPU time of the calling thread, if available
+
+if sys.version_info[0] >= 3:
+    def view_bytes(data, start, end):
+        """
+        Returns part of bytes-like object without copying it.
+        """
+        return memoryview(data)[start:end]
+else:  # NumPy and array of Python 2 do not accept memoryview, so the part is copied
+    def view_bytes(data, start, end):
+        """
+        Returns part of bytes-like object.
+        """
+        return data[start:end]
+
+
+class PixelBuffer(object):
+    """
+    Pixels of a region held in one buffer.
+    Whole rows are read without copying and engines compute results straight into the preallocated buffer,
+    which is then handed to preview or pixel region as it is.
+    """
+    def __init__(self, width, height, bpp, data=None):
+        self.width = width
+        self.height = height
+        self.bpp = bpp
+        self.rowstride = width * bpp
+        self.data = bytearray(height * self.rowstride) if data is None else data
+
+    def read(self, x_start, x_end, y_start, y_end):
+        """
+        Returns pixels of the block, whole rows are viewed without copying.
+        """
+        if x_start == 0 and x_end == self.width:  # Whole rows are contiguous
+            return view_bytes(self.data, y_start * self.rowstride, y_end * self.rowstride)
+        return b''.join([self.data[y * self.rowstride + x_start * self.bpp:y * self.rowstride + x_end * self.bpp]
+                         for y in range(y_start, y_end)])
+
+    def target(self, y_start, y_end):
+        """
+        Returns (buffer, offset) of rows, that an engine writes its result into.
+        """
+        return self.data, y_start * self.rowstride
+
+
+def load_numpy():
+    """
+    Imports NumPy on first use. Returns the module, or None when NumPy is not available.
+    """
+    global numpy, numpy_loaded
+    if not numpy_loaded:
+        try:
+            import numpy as module
+        except ImportError:  # NumPy is optional, the Python loop is used without it
+            module = None
+        numpy, numpy_loaded = module, True
+    return numpy
+
+
+class ProgressReporter(object):
+    """
+    Reports progress from 0.0 to 1.0 at most rate times per second and checks, whether computation was cancelled.
+    Progress is advanced and reported only from one thread, e.g. the one reading and writing blocks.
+    """
+    def __init__(self, update=None, cancelled=None, rate=10):
+        self.update = update
+        self.cancel_check = cancelled
+        self.interval = 1.0 / rate
+        self.progress = 0.0
+        self.reported = None  # Time of the last update
+
+    def set(self, progress, force=False):
+        """
+        Sets progress, it is reported only if the last update is older than interval, or if it is forced.
+        """
+        self.progress = min(progress, 1.0)
+        now = time.time()
+        if self.update is not None and (force or self.reported is None or now - self.reported >= self.interval):
+            self.reported = now
+            self.update(self.progress)
+
+    def advance(self, amount):
+        """
+        Adds amount (part of the whole computation) to progress.
+        """
+        self.set(self.progress + amount)
+
+    def finish(self):
+        """
+        Reports finished computation regardless of the interval.
+        """
+        self.set(1.0, True)
+
+    def cancelled(self):
+        """
+        Returns True, if computation should stop.
+        """
+        return self.cancel_check is not None and bool(self.cancel_check())
+
+
+class ConvolutionCore(object):
+    """
+    Kernels and engines, that detect edges in blocks of pixels.
+    Pixels are read and written with callbacks, so the same engines serve GIMP pixel regions,
+    buffers in memory and image files.
+    """
+    # Integer weights of R, G, B channels and their divisor for grayscale conversion
+    LUMA_WEIGHTS = {'Average': (1, 1, 1, 3),
+                    'Rec601': (299, 587, 114, 1000),
+                    'Rec709': (2126, 7152, 722, 10000)}
+    FFT_KERNEL_AREA = 400  # Kernels larger than this, that are not separable, are applied with FFT (break-even)
+    COLOR_CHANNELS = {1: 1, 2: 1, 3: 3, 4: 3}  # Color channels of GRAY, GRAYA, RGB and RGBA by bytes per pixel
+    TILE_SIZE = (64, 64)  # Width and height of tiles, bands and selected blocks are aligned to them
+    ENGINE_VERSION = 1  # Part of the cache key, increase it whenever results of the same input change
+    CACHE_DIRECTORY = 'convolution_cache'  # Directory of cached results inside of the directory attribute
+    CACHE_LIMIT = 512 * 1024 * 1024  # Maximum size of cached results in bytes
+    CACHE_BLOCK = struct.Struct('<4I')  # Header of cached block: x_start, x_end, y_start, y_end
+    TIMING_LOG_VARIABLE = 'CONVOLUTION_TIMING_LOG'  # Environment variable with path of timing log, no timing without it
+    PROFILE_VARIABLE = 'CONVOLUTION_PROFILE'  # Environment variable with capture modes: cprofile, tracemalloc
+    PROFILE_ENTRIES = 10  # Number of functions and allocation sites in captured profile
+    PROGRESS_RATE = 10  # Maximum number of progress updates per second
+    EDGE_MODE = 2  # Display type of fused pipeline: blur, gradient, non-maximum suppression and hysteresis
+    HYSTERESIS_HALO = 16  # Pixels around a block, through which weak edges can reach strong ones
+    EDGE_MARKS = bytearray([0, 0, 1]) + bytearray(253)  # Translation of hysteresis marks to edges
+    MAGNITUDE_TYPES = ('Exact', 'L1', 'Alpha max beta min')  # Integer magnitudes of display type 0
+    # int(sqrt(square)) limited to 255 for sums of squares of X and Y sums limited to 255
+    MAGNITUDE_TABLE = (bytearray().join(bytearray([value]) * (2 * value + 1) for value in range(255)) +
+                       bytearray([255]) * (255 ** 2 + 1))
+    SUM_LIMIT = 32767  # Largest sum of kernel, that is accumulated in int16 with NumPy
+
+    def __init__(self):
+        """
+        Constructor that declares kernels and default values of the engines.
+        """
+        self.luma_type = 'Average'
+        self.magnitude_type = 'Exact'  # One of MAGNITUDE_TYPES
+        self.kernels_x = {'Sobel': [[1, 0, -1],
+                                    [2, 0, -2],
+                                    [1, 0, -1]],
+                          'Roberts': [[1, 0],
+                                      [0, -1]],
+                          'Prewitt': [[-1, 0, 1],
+                                      [-1, 0, 1],
+                                      [-1, 0, 1]]}
+        self.kernels_y = {'Sobel': [[1, 2, 1],
+                                    [0, 0, 0],
+                                    [-1, -2, -1]],
+                          'Roberts': [[0, 1],
+                                      [-1, 0]],
+                          'Prewitt': [[-1, -1, -1],
+                                      [0, 0, 0],
+                                      [1, 1, 1]]}
+        # Larger operators, X kernel is outer product of smoothing and derivative vectors, Y kernel is its transposition
+        self.register_kernel('Scharr', self.outer_kernel([3, 10, 3], [1, 0, -1]))
+        self.register_kernel('Sobel 5x5', self.outer_kernel([1, 4, 6, 4, 1], [1, 2, 0, -2, -1]))
+        self.register_kernel('Sobel 7x7', self.outer_kernel([1, 6, 15, 20, 15, 6, 1], [1, 4, 5, 0, -5, -4, -1]))
+        self.register_kernel('Laplacian of Gaussian', [[0, 0, -1, 0, 0],
+                                                       [0, -1, -2, -1, 0],
+                                                       [-1, -2, 16, -2, -1],
+                                                       [0, -1, -2, -1, 0],
+                                                       [0, 0, -1, 0, 0]], None)
+        self.band_height = 0  # Rows per band in streaming mode, 0 uses tile height
+        self.workers = 0  # Number of worker threads, 0 uses all CPUs
+        self.cache = False  # Results are cached on disk and reused for unchanged inputs
+        self.edge_blur = 1  # Radius of blur before gradient in edge pipeline, 0 turns it off
+        self.edge_low = 40  # Gradient magnitude of weak edges, they stay only if connected to strong ones
+        self.edge_high = 100  # Gradient magnitude of strong edges
+        self.directory = os.path.join(os.path.expanduser('~'), '.convolution')  # Directory of cached results
+        self.timings = None  # Wall and CPU time of phases of the current run, None when timing is off
+        self.timings_lock = threading.Lock()
+        self.timing_clock = None
+        self.profiler = None
+
+    def tile_size(self):
+        """
+        Returns width and height of tiles, that bands and selected blocks are aligned to.
+        """
+        return self.TILE_SIZE
+
+    def progress_update(self, progress):
+        """
+        Reports progress of computation from 0.0 to 1.0, nothing is shown by default.
+        """
+
+    def progress_reporter(self, cancelled=None):
+        """
+        Returns reporter of progress, that throttles progress_update to PROGRESS_RATE updates per second.
+        cancelled() callback returns True, when computation should stop.
+        """
+        return ProgressReporter(self.progress_update, cancelled, self.PROGRESS_RATE)
+
+    def outer_kernel(self, smoothing, derivative):
+        """
+        Builds X kernel as outer product of smoothing and derivative vectors.
+        """
+        return [[weight * value for value in derivative] for weight in smoothing]
+
+    def pad_kernel(self, kernel, width, height):
+        """
+        Pads kernel with zeros to width x height, so its center stays at the same pixel.
+        """
+        left, top = width // 2 - len(kernel) // 2, height // 2 - len(kernel[0]) // 2
+        padded = [[0] * height for x in range(width)]
+        for x, column in enumerate(kernel):
+            padded[left + x][top:top + len(column)] = column
+        return padded
+
+    def register_kernel(self, name, kernel_x, kernel_y=False):
+        """
+        Adds N x M kernel to the kernels available for edge detection.
+        Y kernel defaults to transposition of X kernel, None means kernel with single response (e.g. Laplacian).
+        Kernels of different sizes are padded to the same size.
+        """
+        for kernel in [kernel_x] + ([kernel_y] if kernel_y not in (False, None) else []):  # Empty Y kernel is error
+            if not kernel or not kernel[0] or any(len(row) != len(kernel[0]) for row in kernel):
+                raise ValueError("Kernel '%s' must be a non-empty matrix" % name)
+        if kernel_y is False:
+            kernel_y = [list(row) for row in zip(*kernel_x)]
+        elif kernel_y is None:
+            kernel_y = [[0] * len(kernel_x[0]) for row in kernel_x]
+        width = max(len(kernel_x), len(kernel_y))
+        height = max(len(kernel_x[0]), len(kernel_y[0]))
+        self.kernels_x[name] = self.pad_kernel(kernel_x, width, height)
+        self.kernels_y[name] = self.pad_kernel(kernel_y, width, height)
+
+    def parse_kernel_spec(self, spec):
+        """
+        Parses custom kernel, e.g. "1 0 -1; 2 0 -2; 1 0 -1 | 1 2 1; 0 0 0; -1 -2 -1".
+        Rows are separated by ';', values by spaces or commas, X and Y kernels by '|'.
+        Without Y kernel, X kernel is used alone.
+        """
+        kernels = [[[int(value) for value in row.replace(',', ' ').split()]
+                    for row in part.split(';') if row.strip()]
+                   for part in spec.split('|')]
+        if len(kernels) > 2:
+            raise ValueError("Custom kernel can contain only X and Y kernels")
+        return kernels[0], kernels[1] if len(kernels) > 1 else None
+
+    def clamp_color_value(self, value):
+        """
+        Limits color value from 0 to 255.
+        """
+        return max(min(255, value), 0)
+
+    def separate_kernel(self, kernel):
+        """
+        Splits kernel into column and row vectors, if it is separable (has rank 1).
+        Row vector is the first nonzero row divided by greatest common divisor of its values,
+        so factors of all rows are integers (e.g. row 3 0 -3 of Scharr becomes 1 0 -1 with factors 3 10 3).
+        Kernel is indexed as kernel[x][y], same as in convolution loop.
+        Returns None for kernels, that can not be separated (e.g. Roberts).
+        """
+        rows = [[kernel[x][y] for x in range(len(kernel))] for y in range(len(kernel[0]))]
+        pivot_y = pivot_x = None
+        for y, row in enumerate(rows):
+            for x, value in enumerate(row):
+                if value != 0 and pivot_y is None:
+                    pivot_y, pivot_x = y, x
+        if pivot_y is None:
+            return None
+        divisor = 0
+        for value in rows[pivot_y]:  # Euclid's algorithm, math.gcd is not available in Python 2
+            divisor, value = abs(value), divisor
+            while value:
+                divisor, value = value, divisor % value
+        row_vector = [value // divisor for value in rows[pivot_y]]
+        column_vector = []
+        for row in rows:
+            if row[pivot_x] % row_vector[pivot_x] != 0:
+                return None
+            factor = row[pivot_x] // row_vector[pivot_x]
+            if [factor * value for value in row_vector] != row:
+                return None
+            column_vector.append(factor)
+        return column_vector, row_vector
+
+    def kernel_method(self, kernel):
+        """
+        Chooses how kernel is applied with NumPy: 'separable' for kernels of rank 1 (Sobel, Prewitt),
+        'fft' for other large kernels and 'direct' for the rest.
+        """
+        if self.separate_kernel(kernel) is not None:
+            return 'separable'
+        if len(kernel) * len(kernel[0]) > self.FFT_KERNEL_AREA and any(any(row) for row in kernel):
+            return 'fft'
+        return 'direct'
+
+    def correlate_fft(self, spectrum, kernel, columns, rows, width, height):
+        """
+        Applies kernel to padded grayscale plane with FFT, spectrum is FFT of the plane (rows x columns).
+        Plane contains halo on all sides, so values wrapped around by circular convolution
+        are not part of the result.
+        """
+        kernel_width, kernel_height = len(kernel), len(kernel[0])
+        weights = numpy.zeros((rows, columns))
+        for y in range(kernel_height):
+            for x in range(kernel_width):
+                weights[(-y) % rows, (-x) % columns] += kernel[x][y]
+        result = numpy.fft.irfft2(spectrum * numpy.fft.rfft2(weights), s=(rows, columns))[:height, :width]
+        return numpy.rint(result).astype(numpy.int64)
+
+    def correlate_numpy(self, padded, kernel, width, height):
+        """
+        Applies kernel to padded grayscale plane with whole-array operations, sums have the type of the plane.
+        Separable kernels (Sobel, Prewitt) are applied as two 1D passes.
+        """
+        separated = self.separate_kernel(kernel)
+        result = numpy.zeros((height, width), dtype=padded.dtype)
+        if separated is not None:
+            column_vector, row_vector = separated
+            horizontal = numpy.zeros((padded.shape[0], width), dtype=padded.dtype)
+            for x, value in enumerate(row_vector):  # Horizontal pass
+                if value != 0:
+                    horizontal += value * padded[:, x:x + width]
+            for y, value in enumerate(column_vector):  # Vertical pass
+                if value != 0:
+                    result += value * horizontal[y:y + height, :]
+            return result
+        for y in range(len(kernel[0])):
+            for x in range(len(kernel)):
+                if kernel[x][y] != 0:
+                    result += kernel[x][y] * padded[y:y + height, x:x + width]
+        return result
+
+    def luminance_plane(self, src_pixels, bpp):
+        """
+        Converts pixels to grayscale plane once, so both kernels read the same compact buffer.
+        Gray pixels are already the plane, so their first channel is taken as it is.
+        Returns NumPy array, or array('B') when NumPy is not available.
+        """
+        weight_r, weight_g, weight_b, divisor = self.LUMA_WEIGHTS[self.luma_type]
+        if load_numpy() is not None:
+            pixels = numpy.frombuffer(src_pixels, dtype=numpy.uint8).reshape(-1, bpp)
+            if self.COLOR_CHANNELS[bpp] == 1:
+                return pixels[:, 0]
+            # Weighted sums are accumulated in place in the narrowest unsigned type, that holds them
+            if divisor == 3:  # Average of RGB values
+                plane = pixels[:, 0].astype(numpy.uint16)
+                plane += pixels[:, 1]
+                plane += pixels[:, 2]
+            else:
+                plane = weight_r * pixels[:, 0].astype(numpy.uint32)
+                plane += weight_g * pixels[:, 1].astype(numpy.uint32)
+                plane += weight_b * pixels[:, 2].astype(numpy.uint32)
+            plane //= divisor
+            return plane.astype(numpy.uint8)
+        if self.COLOR_CHANNELS[bpp] == 1:
+            return array.array('B', src_pixels[0::bpp])
+        pixels = array.array('B', src_pixels)
+        channels_r, channels_g, channels_b = pixels[0::bpp], pixels[1::bpp], pixels[2::bpp]
+        if divisor == 3:  # Average of RGB values
+            return array.array('B', [(r + g + b) // 3 for r, g, b in zip(channels_r, channels_g, channels_b)])
+        return array.array('B', [(weight_r * r + weight_g * g + weight_b * b) // divisor
+                                 for r, g, b in zip(channels_r, channels_g, channels_b)])
+
+    def gradient_numpy(self, plane, kernel_x, kernel_y, width, height):
+        """
+        Applies X and Y kernels to padded grayscale plane (2D array), returns their sums for width x height pixels.
+        """
+        rows, columns = plane.shape
+        spectrum = None  # Computed only if some kernel needs it, then shared by both kernels
+        sums = []
+        for kernel in (kernel_x, kernel_y):
+            if self.kernel_method(kernel) == 'fft':
+                if spectrum is None:
+                    spectrum = numpy.fft.rfft2(plane)
+                sums.append(self.correlate_fft(spectrum, kernel, columns, rows, width, height))
+            else:
+                sums.append(self.correlate_numpy(plane, kernel, width, height))
+        return sums
+
+    def sum_dtype(self, kernel_x, kernel_y):
+        """
+        Returns the narrowest NumPy integer type, that holds sums of both kernels for any grayscale values.
+        Partial sums are never larger than the whole sum of absolute weights times 255.
+        """
+        largest = max(sum(abs(value) for column in kernel for value in column) for kernel in (kernel_x, kernel_y))
+        return numpy.int16 if 255 * largest <= self.SUM_LIMIT else numpy.int32
+
+    def magnitude_numpy(self, sum_x, sum_y):
+        """
+        Returns magnitude of gradient limited to 255 as uint8 array, same as magnitude of convolute_loop.
+        Sums of 255 and more always give 255, so they are limited first and their squares fit into int32.
+        """
+        sum_x = numpy.minimum(numpy.abs(sum_x), 255).astype(numpy.int32)
+        sum_y = numpy.minimum(numpy.abs(sum_y), 255).astype(numpy.int32)
+        if self.magnitude_type == 'L1':
+            magnitude = sum_x + sum_y
+        elif self.magnitude_type == 'Alpha max beta min':
+            magnitude = (8 * numpy.maximum(sum_x, sum_y) + 3 * numpy.minimum(sum_x, sum_y)) >> 3
+        else:
+            sum_x *= sum_x
+            sum_x += sum_y * sum_y
+            return numpy.frombuffer(self.MAGNITUDE_TABLE, dtype=numpy.uint8)[sum_x]
+        numpy.minimum(magnitude, 255, out=magnitude)
+        return magnitude.astype(numpy.uint8)
+
+    def convolute_numpy(self, src_pixels, plane, width, height, bpp, kernel_x, kernel_y, color_mode, out=None):
+        """
+        Computes edges for a block of pixels with NumPy.
+        src_pixels and grayscale plane contain the block together with halo on all sides.
+        Gray pixels get the magnitude, or the x sum in Red and Blue mode, as they have no other color channels.
+        Result is written into out (buffer, offset) and None is returned, or it is returned as bytes without out.
+        Output is byte-identical to the output of convolute_loop.
+        """
+        kernel_width, kernel_height = len(kernel_x), len(kernel_x[0])
+        columns, rows = width + kernel_width - 1, height + kernel_height - 1
+        pixels = numpy.frombuffer(src_pixels, dtype=numpy.uint8).reshape(rows, columns, bpp)
+        dtype = self.sum_dtype(kernel_x, kernel_y)
+        sum_x, sum_y = self.gradient_numpy(plane.reshape(rows, columns).astype(dtype), kernel_x, kernel_y,
+                                           width, height)
+
+        offset_x, offset_y = kernel_width // 2, kernel_height // 2
+        channels = self.COLOR_CHANNELS[bpp]
+        if out is None:
+            dst_pixels = numpy.empty((height, width, bpp), dtype=numpy.uint8)
+        else:  # View of the output buffer, so results are not copied
+            dst_pixels = numpy.frombuffer(out[0], dtype=numpy.uint8, count=height * width * bpp,
+                                          offset=out[1]).reshape(height, width, bpp)
+        if bpp > channels:  # Alpha is copied from the source
+            dst_pixels[:, :, channels] = pixels[offset_y:offset_y + height, offset_x:offset_x + width, channels]
+        if color_mode == 1:
+            dst_pixels[:, :, 0] = numpy.clip(sum_x, 0, 255)
+            if channels == 3:
+                dst_pixels[:, :, 1] = numpy.clip(sum_y // 2, 0, 255)
+                dst_pixels[:, :, 2] = numpy.clip(sum_y, 0, 255)
+        else:
+            dst_pixels[:, :, 0:channels] = self.magnitude_numpy(sum_x, sum_y)[:, :, numpy.newaxis]
+        return dst_pixels.tobytes() if out is None else None
+
+    def convolute_loop(self, src_pixels, plane, width, height, bpp, kernel_x, kernel_y, color_mode, out=None):
+        """
+        Computes edges for a block of pixels pixel by pixel. Used when NumPy is not available.
+        src_pixels and grayscale plane contain the block together with halo on all sides.
+        Result is written into out (buffer, offset) and None is returned, or it is returned as bytes without out.
+        """
+        kernel_width, kernel_height = len(kernel_x), len(kernel_x[0])
+        offset_x, offset_y = kernel_width // 2, kernel_height // 2
+        columns = width + kernel_width - 1
+        channels = self.COLOR_CHANNELS[bpp]
+        magnitude_type, table = self.MAGNITUDE_TYPES.index(self.magnitude_type), self.MAGNITUDE_TABLE
+        dst_pixels = bytearray(width * height * bpp)  # Every pixel is overwritten
+        if bpp > channels:  # Alpha is copied from the source row by row
+            for pos_y in range(0, height):
+                center_pos = (offset_x + columns * (pos_y + offset_y)) * bpp + channels
+                dst_pixels[width * pos_y * bpp + channels:width * (pos_y + 1) * bpp:bpp] = \
+                    src_pixels[center_pos:center_pos + width * bpp:bpp]
+        # Traverse every pixel in block
+        for pos_y in range(0, height):
+            for pos_x in range(0, width):
+                center_sum_x = 0
+                center_sum_y = 0
+                # Cycle through surrounding pixels
+                for y in range(0, kernel_height):
+                    row_pos = columns * (pos_y + y) + pos_x  # Halo is already in the plane
+                    for x in range(0, kernel_width):
+                        grayscale_value = plane[row_pos + x]
+                        center_sum_x += grayscale_value * kernel_x[x][y]  # Multiply by x kernel
+                        center_sum_y += grayscale_value * kernel_y[x][y]  # Multiply by y kernel
+                dst_pos = (pos_x + width * pos_y) * bpp
+                if color_mode == 1:
+                    dst_pixels[dst_pos] = self.clamp_color_value(center_sum_x)
+                    if channels == 3:
+                        dst_pixels[dst_pos + 1] = self.clamp_color_value(center_sum_y // 2)
+                        dst_pixels[dst_pos + 2] = self.clamp_color_value(center_sum_y)
+                else:
+                    # Integers only, sums of 255 and more always give 255
+                    abs_x, abs_y = abs(center_sum_x), abs(center_sum_y)
+                    if abs_x >= 255 or abs_y >= 255:
+                        value = 255
+                    elif magnitude_type == 0:  # Exact, int(sqrt()) from the table
+                        value = table[abs_x * abs_x + abs_y * abs_y]
+                    elif magnitude_type == 1:  # L1, sum of absolute values
+                        value = min(abs_x + abs_y, 255)
+                    else:  # Alpha max beta min, max + 3 / 8 min
+                        value = min((8 * max(abs_x, abs_y) + 3 * min(abs_x, abs_y)) >> 3, 255)
+                    for channel in range(channels):
+                        dst_pixels[dst_pos + channel] = value
+        if out is not None:
+            out[0][out[1]:out[1] + len(dst_pixels)] = dst_pixels
+            return None
+        return bytes(dst_pixels)
+
+    def blur_vector(self, radius):
+        """
+        Returns binomial weights of 2 * radius + 1 pixels, they approximate Gaussian blur with integers.
+        """
+        vector = [1]
+        for _ in range(2 * radius):
+            vector = [left + right for left, right in zip(vector + [0], [0] + vector)]
+        return vector
+
+    def gradient_axes(self, kernel_x, kernel_y):
+        """
+        Returns matrix (a, b, c, d), that turns sums of X and Y kernels into a vector along the gradient:
+        (d * sum_x - b * sum_y, a * sum_y - c * sum_x) points along image columns and rows.
+        Kernels are measured by their response to ramps along columns and rows, as kernels_x and kernels_y
+        of different operators do not agree on direction (e.g. X kernel of Sobel responds to vertical change).
+        Kernels without direction (e.g. Laplacian) use their sums as they are.
+        """
+        size_x, size_y = len(kernel_x), len(kernel_x[0])
+        a = sum(kernel_x[x][y] * x for x in range(size_x) for y in range(size_y))
+        b = sum(kernel_x[x][y] * y for x in range(size_x) for y in range(size_y))
+        c = sum(kernel_y[x][y] * x for x in range(size_x) for y in range(size_y))
+        d = sum(kernel_y[x][y] * y for x in range(size_x) for y in range(size_y))
+        if a * d - b * c == 0:
+            return 0, -1, 1, 0  # sum_x along columns, sum_y along rows
+        return a, b, c, d
+
+    def block_halo(self, kernel_x, color_mode):
+        """
+        Returns pixels (left, right, top, bottom), that are read around a block, so its result can be computed.
+        Edge pipeline adds pixels for blur, non-maximum suppression and hysteresis.
+        """
+        kernel_width, kernel_height = len(kernel_x), len(kernel_x[0])
+        offset_x, offset_y = kernel_width // 2, kernel_height // 2
+        extra = self.edge_blur + 1 + self.HYSTERESIS_HALO if color_mode == self.EDGE_MODE else 0
+        return (offset_x + extra, kernel_width - 1 - offset_x + extra,
+                offset_y + extra, kernel_height - 1 - offset_y + extra)
+
+    def hysteresis(self, weak, strong, columns, rows):
+        """
+        Follows weak edge pixels (weak[index] is 1) connected to strong ones (list of indexes)
+        in 8 directions. Returns bytearray with 1 for pixels of edges and 0 for the rest.
+        """
+        stride = columns + 2  # Marks have border of one pixel, so neighbours are never outside
+        marks = bytearray(stride * (rows + 2))  # 0: no edge, 1: weak edge, 2: edge connected to strong one
+        for y in range(rows):
+            marks[(y + 1) * stride + 1:(y + 1) * stride + 1 + columns] = weak[y * columns:(y + 1) * columns]
+        stack = [(index // columns + 1) * stride + index % columns + 1 for index in strong]
+        for index in stack:
+            marks[index] = 2
+        steps = (-stride - 1, -stride, -stride + 1, -1, 1, stride - 1, stride, stride + 1)
+        while stack:
+            index = stack.pop()
+            for step in steps:
+                if marks[index + step] == 1:
+                    marks[index + step] = 2
+                    stack.append(index + step)
+        edges = bytearray(columns * rows)
+        for y in range(rows):
+            edges[y * columns:(y + 1) * columns] = marks[(y + 1) * stride + 1:(y + 1) * stride + 1 + columns]
+        return edges.translate(self.EDGE_MARKS)
+
+    def detect_edges_numpy(self, src_pixels, plane, width, height, bpp, kernel_x, kernel_y, out=None):
+        """
+        Computes edges for a block with fused pipeline with NumPy: blur, gradient, non-maximum suppression
+        and hysteresis thresholding. All stages work on the block in memory, src_pixels and grayscale plane
+        contain the block together with halo from block_halo.
+        Edge pixels are white and the rest is black, alpha is copied from the source.
+        Result is written into out (buffer, offset) and None is returned, or it is returned as bytes without out.
+        Output is byte-identical to the output of detect_edges_loop.
+        """
+        left, right, top, bottom = self.block_halo(kernel_x, self.EDGE_MODE)
+        columns, rows = width + left + right, height + top + bottom
+        pixels = numpy.frombuffer(src_pixels, dtype=numpy.uint8).reshape(rows, columns, bpp)
+        plane = plane.reshape(rows, columns).astype(numpy.int32)
+
+        # Blur, separable binomial weights, rounded integer average
+        radius = self.edge_blur
+        vector = self.blur_vector(radius)
+        columns, rows = columns - 2 * radius, rows - 2 * radius
+        horizontal = numpy.zeros((plane.shape[0], columns), dtype=numpy.int32)
+        for x, value in enumerate(vector):
+            horizontal += value * plane[:, x:x + columns]
+        blurred = numpy.zeros((rows, columns), dtype=numpy.int32)
+        for y, value in enumerate(vector):
+            blurred += value * horizontal[y:y + rows, :]
+        total = sum(vector) ** 2
+        blurred = (blurred + total // 2) // total
+
+        # Gradient and its magnitude
+        halo = self.HYSTERESIS_HALO
+        columns, rows = width + 2 * halo + 2, height + 2 * halo + 2
+        sum_x, sum_y = [numpy.asarray(part, dtype=numpy.int64)
+                        for part in self.gradient_numpy(blurred, kernel_x, kernel_y, columns, rows)]
+        magnitude = numpy.sqrt(numpy.square(sum_x, dtype=numpy.float64) +
+                               numpy.square(sum_y, dtype=numpy.float64)).astype(numpy.int64)
+
+        # Non-maximum suppression, pixel stays, if it is the largest of its neighbours along the gradient
+        a, b, c, d = self.gradient_axes(kernel_x, kernel_y)
+        along_x = d * sum_x - b * sum_y
+        along_y = a * sum_y - c * sum_x
+        along_x, along_y = along_x[1:-1, 1:-1], along_y[1:-1, 1:-1]
+        columns, rows = columns - 2, rows - 2
+        center = magnitude[1:-1, 1:-1]
+
+        def neighbour(step_x, step_y):
+            return magnitude[1 + step_y:1 + step_y + rows, 1 + step_x:1 + step_x + columns]
+        distance_x, distance_y = numpy.abs(along_x), numpy.abs(along_y)
+        horizontal = 169 * distance_y <= 70 * distance_x  # Closer to columns than 22.5 degrees (70 / 169 = tan)
+        vertical = ~horizontal & (70 * distance_y >= 169 * distance_x)
+        falling = ~horizontal & ~vertical & ((along_x > 0) == (along_y > 0))  # Diagonal from top left
+        before = numpy.where(horizontal, neighbour(-1, 0), numpy.where(vertical, neighbour(0, -1),
+                             numpy.where(falling, neighbour(-1, -1), neighbour(1, -1))))
+        after = numpy.where(horizontal, neighbour(1, 0), numpy.where(vertical, neighbour(0, 1),
+                            numpy.where(falling, neighbour(1, 1), neighbour(-1, 1))))
+        suppressed = numpy.where((center > before) & (center >= after), center, 0)
+
+        # Hysteresis, weak pixels stay, if they are connected to strong ones inside of the block with halo
+        low, high = min(self.edge_low, self.edge_high), self.edge_high
+        weak = (suppressed >= max(low, 1)).astype(numpy.uint8).tobytes()
+        strong = numpy.flatnonzero(suppressed >= max(high, 1)).tolist()
+        edges = numpy.frombuffer(self.hysteresis(weak, strong, columns, rows), dtype=numpy.uint8)
+        edges = edges.reshape(rows, columns)[halo:halo + height, halo:halo + width]
+
+        channels = self.COLOR_CHANNELS[bpp]
+        if out is None:
+            dst_pixels = numpy.empty((height, width, bpp), dtype=numpy.uint8)
+        else:  # View of the output buffer, so results are not copied
+            dst_pixels = numpy.frombuffer(out[0], dtype=numpy.uint8, count=height * width * bpp,
+                                          offset=out[1]).reshape(height, width, bpp)
+        if bpp > channels:  # Alpha is copied from the source
+            dst_pixels[:, :, channels] = pixels[top:top + height, left:left + width, channels]
+        dst_pixels[:, :, 0:channels] = (edges * 255)[:, :, numpy.newaxis]
+        return dst_pixels.tobytes() if out is None else None
+
+    def detect_edges_loop(self, src_pixels, plane, width, height, bpp, kernel_x, kernel_y, out=None):
+        """
+        Computes edges for a block with fused pipeline pixel by pixel. Used when NumPy is not available.
+        src_pixels and grayscale plane contain the block together with halo from block_halo.
+        Result is written into out (buffer, offset) and None is returned, or it is returned as bytes without out.
+        """
+        left, right, top, bottom = self.block_halo(kernel_x, self.EDGE_MODE)
+        columns, rows = width + left + right, height + top + bottom
+        kernel_width, kernel_height = len(kernel_x), len(kernel_x[0])
+
+        # Blur, separable binomial weights, rounded integer average
+        radius = self.edge_blur
+        vector = self.blur_vector(radius)
+        size = len(vector)
+        total = sum(vector) ** 2
+        blur_columns, blur_rows = columns - 2 * radius, rows - 2 * radius
+        horizontal = [sum(vector[x] * plane[row_pos + pos_x + x] for x in range(size))
+                      for row_pos in range(0, rows * columns, columns) for pos_x in range(blur_columns)]
+        blurred = [(sum(vector[y] * horizontal[(pos_y + y) * blur_columns + pos_x] for y in range(size))
+                    + total // 2) // total
+                   for pos_y in range(blur_rows) for pos_x in range(blur_columns)]
+
+        # Gradient and its magnitude
+        halo = self.HYSTERESIS_HALO
+        grad_columns, grad_rows = width + 2 * halo + 2, height + 2 * halo + 2
+        sums_x, sums_y, magnitude = [], [], []
+        for pos_y in range(grad_rows):
+            for pos_x in range(grad_columns):
+                center_sum_x = 0
+                center_sum_y = 0
+                for y in range(kernel_height):
+                    row_pos = blur_columns * (pos_y + y) + pos_x
+                    for x in range(kernel_width):
+                        grayscale_value = blurred[row_pos + x]
+                        center_sum_x += grayscale_value * kernel_x[x][y]
+                        center_sum_y += grayscale_value * kernel_y[x][y]
+                sums_x.append(center_sum_x)
+                sums_y.append(center_sum_y)
+                magnitude.append(int(math.sqrt(center_sum_x ** 2 + center_sum_y ** 2)))
+
+        # Non-maximum suppression, pixel stays, if it is the largest of its neighbours along the gradient
+        a, b, c, d = self.gradient_axes(kernel_x, kernel_y)
+        columns, rows = grad_columns - 2, grad_rows - 2
+        low, high = max(min(self.edge_low, self.edge_high), 1), max(self.edge_high, 1)
+        weak = bytearray(columns * rows)
+        strong = []
+        for pos_y in range(rows):
+            for pos_x in range(columns):
+                index = (pos_y + 1) * grad_columns + pos_x + 1
+                value = magnitude[index]
+                if value < low:
+                    continue
+                along_x = d * sums_x[index] - b * sums_y[index]
+                along_y = a * sums_y[index] - c * sums_x[index]
+                if 169 * abs(along_y) <= 70 * abs(along_x):  # Closer to columns than 22.5 degrees
+                    step = 1
+                elif 70 * abs(along_y) >= 169 * abs(along_x):
+                    step = grad_columns
+                elif (along_x > 0) == (along_y > 0):  # Diagonal from top left
+                    step = grad_columns + 1
+                else:
+                    step = grad_columns - 1
+                if value > magnitude[index - step] and value >= magnitude[index + step]:
+                    weak[pos_y * columns + pos_x] = 1
+                    if value >= high:
+                        strong.append(pos_y * columns + pos_x)
+
+        # Hysteresis, weak pixels stay, if they are connected to strong ones inside of the block with halo
+        edges = self.hysteresis(weak, strong, columns, rows)
+        channels = self.COLOR_CHANNELS[bpp]
+        dst_pixels = bytearray(width * height * bpp)
+        for pos_y in range(height):
+            if bpp > channels:  # Alpha is copied from the source row by row
+                center_pos = (left + (width + left + right) * (pos_y + top)) * bpp + channels
+                dst_pixels[width * pos_y * bpp + channels:width * (pos_y + 1) * bpp:bpp] = \
+                    src_pixels[center_pos:center_pos + width * bpp:bpp]
+            for pos_x in range(width):
+                if edges[(pos_y + halo) * columns + pos_x + halo]:
+                    dst_pos = (pos_x + width * pos_y) * bpp
+                    for channel in range(channels):
+                        dst_pixels[dst_pos + channel] = 255
+        if out is not None:
+            out[0][out[1]:out[1] + len(dst_pixels)] = dst_pixels
+            return None
+        return bytes(dst_pixels)
+
+    def wrap_ranges(self, first, last, length):
+        """
+        Splits range from first to last (exclusive) into ranges inside of 0 to length.
+        Values outside are taken from the other side (mirror padding).
+        """
+        ranges = []
+        value = first
+        while value < last:
+            start = value % length
+            end = min(start + last - value, length)
+            ranges.append((start, end))
+            value += end - start
+        return ranges
+
+    def read_block(self, read, first_x, last_x, first_y, last_y, width, height, bpp):
+        """
+        Reads block of pixels with read(x_start, x_end, y_start, y_end) callback.
+        Pixels outside of the region are taken from the other side of the region (mirror padding).
+        """
+        column_ranges = self.wrap_ranges(first_x, last_x, width)
+        row_ranges = self.wrap_ranges(first_y, last_y, height)
+        if len(column_ranges) == 1 and len(row_ranges) == 1:  # Block without wrap around is not joined (copied)
+            return read(column_ranges[0][0], column_ranges[0][1], row_ranges[0][0], row_ranges[0][1])
+        chunks = []
+        for y_start, y_end in row_ranges:
+            if len(column_ranges) == 1:
+                chunks.append(read(column_ranges[0][0], column_ranges[0][1], y_start, y_end))
+                continue
+            pieces = [(read(x_start, x_end, y_start, y_end), (x_end - x_start) * bpp)
+                      for x_start, x_end in column_ranges]
+            for y in range(y_end - y_start):  # Join pieces of every row
+                chunks.extend([piece[y * stride:(y + 1) * stride] for piece, stride in pieces])
+        return b''.join(chunks)
+
+    def split_aligned(self, origin, length, size):
+        """
+        Splits range of given length into parts aligned to multiples of size, origin is position of the range.
+        Returns list of (start, end) tuples relative to the range.
+        """
+        parts = []
+        start = 0
+        while start < length:
+            end = min(length, (((origin + start) // size) + 1) * size - origin)
+            parts.append((start, end))
+            start = end
+        return parts
+
+    def split_bands(self, y1, height):
+        """
+        Splits rows of the region into bands aligned to tiles.
+        Returns list of (start, end) tuples relative to the region.
+        """
+        return self.split_aligned(y1, height, max(1, self.band_height or self.tile_size()[1]))
+
+    def split_selected(self, read_mask, x1, width, bands):
+        """
+        Splits bands into blocks, that contain selected pixels. Rows and tiles without selected pixels are left out.
+        read_mask(start, end) returns selection mask of rows (one byte per pixel).
+        Returns list of (x_start, x_end, y_start, y_end) tuples relative to the region.
+        """
+        tiles = self.split_aligned(x1, width, self.tile_size()[0])
+        blocks = []
+        for band_start, band_end in bands:
+            mask = read_mask(band_start, band_end)
+            rows = [mask[y * width:(y + 1) * width] for y in range(band_end - band_start)]
+            selected_rows = [y for y, row in enumerate(rows) if row.strip(b'\0')]
+            if not selected_rows:
+                continue
+            first, last = selected_rows[0], selected_rows[-1] + 1
+            rows = rows[first:last]
+            block_start = None
+            for tile_start, tile_end in tiles + [(width, width)]:  # Empty tile closes the last block
+                selected = any(row[tile_start:tile_end].strip(b'\0') for row in rows)
+                if selected and block_start is None:
+                    block_start = tile_start
+                elif not selected and block_start is not None:
+                    blocks.append((block_start, tile_start, band_start + first, band_start + last))
+                    block_start = None
+        return blocks
+
+    def convolute_block(self, src_pixels, width, height, bpp, kernel_x, kernel_y, color_mode, out=None):
+        """
+        Computes edges for one block with the fastest available engine.
+        Result is written into out (buffer, offset), if it is given, otherwise it is returned.
+        """
+        start = self.clock()
+        plane = self.luminance_plane(src_pixels, bpp)
+        self.record('convert', start, copied=len(plane))
+        start = self.clock()
+        if color_mode == self.EDGE_MODE:
+            engine = self.detect_edges_numpy if load_numpy() is not None else self.detect_edges_loop
+            dst_pixels = engine(src_pixels, plane, width, height, bpp, kernel_x, kernel_y, out)
+        elif load_numpy() is not None:
+            dst_pixels = self.convolute_numpy(src_pixels, plane, width, height, bpp, kernel_x, kernel_y, color_mode,
+                                              out)
+        else:
+            dst_pixels = self.convolute_loop(src_pixels, plane, width, height, bpp, kernel_x, kernel_y, color_mode, out)
+        self.record('compute', start, copied=width * height * bpp, pixels=width * height)
+        return dst_pixels
+
+    def finish_block(self, write, block, dst_pixels, area, reporter):
+        """
+        Writes computed block and advances progress, area is number of pixels in all blocks.
+        Without write callback, the block is already in the output buffer.
+        """
+        x_start, x_end, y_start, y_end = block
+        if write is not None:
+            start = self.clock()
+            write(x_start, x_end, y_start, y_end, dst_pixels)
+            self.record('write', start, copied=len(dst_pixels))
+        if reporter is not None:  # Called from the calling thread of convolute_blocks, same as reading and writing
+            reporter.advance(float((x_end - x_start) * (y_end - y_start)) / area)
+
+    def convolute_blocks(self, read, write, width, height, bpp, kernel_x, kernel_y, color_mode, blocks,
+                         reporter=None, output=None):
+        """
+        Computes edges block by block, blocks are (x_start, x_end, y_start, y_end) tuples.
+        Each block reads only pixels it needs for the kernel and writes its result before it is released.
+        If output(block) returns (buffer, offset), result is computed straight into it and write is not needed.
+        With NumPy, blocks are computed in worker threads (NumPy releases GIL), while reading
+        and writing of pixel regions stays in the calling thread.
+        Progress of written blocks is added to reporter (ProgressReporter), which is also checked
+        for cancellation before every block. Returns False, if computation was cancelled.
+        """
+        left, right, top, bottom = self.block_halo(kernel_x, color_mode)
+        import multiprocessing  # Imported on first use, so the command line starts without it
+        workers = self.workers or multiprocessing.cpu_count()
+        area = sum((x_end - x_start) * (y_end - y_start) for x_start, x_end, y_start, y_end in blocks)
+
+        def cancelled():
+            return reporter is not None and reporter.cancelled()
+
+        def read_source(block):
+            x_start, x_end, y_start, y_end = block
+            start = self.clock()
+            src_pixels = self.read_block(read, x_start - left, x_end + right, y_start - top, y_end + bottom,
+                                         width, height, bpp)
+            self.record('read', start, copied=len(src_pixels))
+            return src_pixels
+
+        if load_numpy() is None or workers < 2 or len(blocks) < 2:
+            for block in blocks:
+                if cancelled():
+                    return False
+                src_pixels = read_source(block)
+                dst_pixels = self.convolute_block(src_pixels, block[1] - block[0], block[3] - block[2], bpp,
+                                                  kernel_x, kernel_y, color_mode, output and output(block))
+                self.finish_block(write, block, dst_pixels, area, reporter)
+                del src_pixels, dst_pixels  # Release buffers of the block
+            return True
+
+        results = queue.Queue()
+
+        def compute(block, src_pixels):
+            try:
+                results.put((block, self.convolute_block(src_pixels, block[1] - block[0], block[3] - block[2],
+                                                         bpp, kernel_x, kernel_y, color_mode,
+                                                         output and output(block)), None))
+            except Exception as error:
+                results.put((block, None, error))
+
+        def collect():
+            block, dst_pixels, error = results.get()
+            if error is not None:
+                raise error
+            self.finish_block(write, block, dst_pixels, area, reporter)
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        pending = 0
+        try:
+            for block in blocks:
+                if cancelled():
+                    return False
+                src_pixels = read_source(block)
+                pool.apply_async(compute, (block, src_pixels))
+                del src_pixels
+                pending += 1
+                if pending >= 2 * workers:  # Limit number of blocks held in memory
+                    collect()
+                    pending -= 1
+            while pending > 0:
+                if cancelled():
+                    return False
+                collect()
+                pending -= 1
+        finally:
+            pool.terminate()
+            pool.join()
+        return True
+
+    def sample_pixels(self, src_pixels, width, height, bpp, scale):
+        """
+        Takes every scale-th pixel in both directions.
+        Returns sampled pixels with their width and height.
+        """
+        sample_width = (width + scale - 1) // scale
+        sample_height = (height + scale - 1) // scale
+        if load_numpy() is not None:
+            pixels = numpy.frombuffer(src_pixels, dtype=numpy.uint8).reshape(height, width, bpp)
+            return pixels[::scale, ::scale].tobytes(), sample_width, sample_height
+        rows = []
+        for y in range(0, height, scale):
+            row = src_pixels[y * width * bpp:(y + 1) * width * bpp]
+            rows.append(b''.join([row[x * bpp:(x + 1) * bpp] for x in range(0, width, scale)]))
+        return b''.join(rows), sample_width, sample_height
+
+    def repeat_pixels(self, src_pixels, width, height, bpp, scale, dst_width, dst_height):
+        """
+        Repeats every pixel scale times in both directions and crops result to dst_width x dst_height.
+        """
+        if load_numpy() is not None:
+            pixels = numpy.frombuffer(src_pixels, dtype=numpy.uint8).reshape(height, width, bpp)
+            pixels = numpy.repeat(numpy.repeat(pixels, scale, axis=0), scale, axis=1)
+            return pixels[:dst_height, :dst_width].tobytes()
+        rows = []
+        for y in range(0, height):
+            row = src_pixels[y * width * bpp:(y + 1) * width * bpp]
+            row = b''.join([row[x * bpp:(x + 1) * bpp] * scale for x in range(0, width)])[:dst_width * bpp]
+            rows.extend([row] * scale)
+        return b''.join(rows[:dst_height])
+
+    def compute_pixels(self, kernel_name, color_mode, src_pixels, width, height, bpp, reporter=None):
+        """
+        Computes edges for pixels, that are already in memory.
+        Source rows are not copied and results are computed straight into one output buffer.
+        Returns bytearray with the result, or None, if computation was cancelled through reporter.
+        """
+        source = PixelBuffer(width, height, bpp, src_pixels)
+        result = PixelBuffer(width, height, bpp)
+        blocks = [(0, width, start, end) for start, end in self.split_bands(0, height)]  # Blocks span whole rows
+        if not self.convolute_blocks(source.read, None, width, height, bpp, self.kernels_x[kernel_name],
+                                     self.kernels_y[kernel_name], color_mode, blocks, reporter,
+                                     lambda block: result.target(block[2], block[3])):
+            return None
+        return result.data
+
+    def compute_preview(self, kernel_name, color_mode, src_pixels, width, height, bpp, reporter=None, scale=1):
+        """
+        Computes edges for preview source pixels.
+        When preview is zoomed in (scale > 1), source pixels are repeated, so edges are computed
+        at drawable resolution and scaled up afterwards.
+        Returns None, if computation was cancelled through reporter.
+        """
+        if scale <= 1:
+            return self.compute_pixels(kernel_name, color_mode, src_pixels, width, height, bpp, reporter)
+        sample_pixels, sample_width, sample_height = self.sample_pixels(src_pixels, width, height, bpp, scale)
+        dst_pixels = self.compute_pixels(kernel_name, color_mode, sample_pixels, sample_width, sample_height, bpp,
+                                         reporter)
+        if dst_pixels is None:
+            return None
+        return self.repeat_pixels(dst_pixels, sample_width, sample_height, bpp, scale, width, height)
+
+    def cache_key(self, read, read_mask, width, height, bpp, kernel_x, kernel_y, color_mode, bands):
+        """
+        Computes key of cached result from source pixels, selection mask and all parameters, that affect the result.
+        Source is read band by band, so it is never held in memory as a whole.
+        """
+        edge_settings = (self.edge_blur, self.edge_low, self.edge_high) if color_mode == self.EDGE_MODE else None
+        magnitude_type = self.magnitude_type if color_mode == 0 else None
+        digest = hashlib.sha1(repr((self.ENGINE_VERSION, kernel_x, kernel_y, color_mode, self.luma_type,
+                                    width, height, bpp, edge_settings, magnitude_type)).encode('ascii'))
+        for start, end in bands:
+            digest.update(read(0, width, start, end))
+            if read_mask is not None:
+                digest.update(read_mask(start, end))
+        return digest.hexdigest()
+
+    def cache_directory(self):
+        """
+        Returns directory of cached results, creates it if it does not exist.
+        """
+        directory = os.path.join(self.directory, self.CACHE_DIRECTORY)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return directory
+
+    def cache_count(self, hit):
+        """
+        Counts cache hit or miss in statistics file of cache directory.
+        Returns total numbers of hits and misses.
+        """
+        path = os.path.join(self.cache_directory(), 'statistics')
+        hits = misses = 0
+        try:
+            with open(path) as statistics:
+                hits, misses = [int(value) for value in statistics.read().split()]
+        except (IOError, OSError, ValueError):
+            pass  # Statistics start again, if file is missing or damaged
+        if hit:
+            hits += 1
+        else:
+            misses += 1
+        with open(path, 'w') as statistics:
+            statistics.write('%d %d' % (hits, misses))
+        return hits, misses
+
+    def cache_load(self, key, write, bpp):
+        """
+        Writes cached blocks of result with write(x_start, x_end, y_start, y_end, pixels) callback.
+        Cached file is decompressed in chunks, so the result is never held in memory as a whole.
+        Returns False, if result is not cached.
+        """
+        path = os.path.join(self.cache_directory(), key)
+        if not os.path.exists(path):
+            return False
+        decompressor = zlib.decompressobj()
+        buffer = bytearray()
+        try:
+            with open(path, 'rb') as cached:
+                while True:
+                    chunk = cached.read(1024 * 1024)
+                    buffer += decompressor.decompress(chunk) if chunk else decompressor.flush()
+                    while len(buffer) >= self.CACHE_BLOCK.size:  # Write all complete blocks
+                        x_start, x_end, y_start, y_end = self.CACHE_BLOCK.unpack(bytes(buffer[:self.CACHE_BLOCK.size]))
+                        end = self.CACHE_BLOCK.size + (x_end - x_start) * (y_end - y_start) * bpp
+                        if len(buffer) < end:
+                            break
+                        write(x_start, x_end, y_start, y_end, bytes(buffer[self.CACHE_BLOCK.size:end]))
+                        del buffer[:end]
+                    if not chunk:
+                        break
+        except (IOError, OSError, zlib.error):
+            os.remove(path)  # Damaged result is computed again and overwrites all written blocks
+            return False
+        os.utime(path, None)  # Modification time orders results for eviction
+        return True
+
+    def cache_writer(self, key, write):
+        """
+        Wraps write callback, so written blocks are also compressed into cache file.
+        Returns the new write callback and close(completed) function, that stores the file or removes it.
+        """
+        path = os.path.join(self.cache_directory(), key)
+        temporary_path = path + '.tmp'
+        cached = open(temporary_path, 'wb')
+        compressor = zlib.compressobj()
+
+        def cache_write(x_start, x_end, y_start, y_end, pixels):
+            write(x_start, x_end, y_start, y_end, pixels)
+            cached.write(compressor.compress(self.CACHE_BLOCK.pack(x_start, x_end, y_start, y_end)))
+            cached.write(compressor.compress(bytes(pixels)))
+
+        def close(completed):
+            if completed:
+                cached.write(compressor.flush())
+            cached.close()
+            if not completed:
+                os.remove(temporary_path)
+                return
+            if os.path.exists(path):  # Rename does not replace files on Windows
+                os.remove(path)
+            os.rename(temporary_path, path)
+            self.cache_evict()
+
+        return cache_write, close
+
+    def cache_evict(self):
+        """
+        Removes least recently used results, until cache fits into its size limit.
+        """
+        directory = self.cache_directory()
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name != 'statistics' and not name.endswith('.tmp'):
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.CACHE_LIMIT:
+                break
+            os.remove(path)
+            size -= file_size
+
+    def timing_start(self):
+        """
+        Starts timing of the run, if path of timing log is set in the environment.
+        Profile of the main thread and memory allocations are captured, when requested by profile variable.
+        """
+        self.timings = None
+        if not os.environ.get(self.TIMING_LOG_VARIABLE):
+            return
+        self.timings = {}
+        modes = os.environ.get(self.PROFILE_VARIABLE, '').split(',')
+        if 'cprofile' in modes:
+            import cProfile  # Profilers are imported only when requested, to keep start up of command line fast
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if 'tracemalloc' in modes:
+            try:
+                import tracemalloc
+                tracemalloc.start()
+            except ImportError:  # Python 2, memory allocations are not captured
+                pass
+        self.timing_clock = (time.time(), process_time())
+
+    def clock(self):
+        """
+        Returns start of a phase for record method, or None when timing is off.
+        """
+        if self.timings is None:
+            return None
+        return time.time(), thread_time()
+
+    def record(self, phase, start, copied=0, pixels=0):
+        """
+        Adds wall and CPU time since start, copied bytes and processed pixels to the phase.
+        Phases run in worker threads too, so their times are summed over all threads.
+        """
+        if start is None:
+            return
+        wall, cpu = time.time() - start[0], thread_time() - start[1]
+        with self.timings_lock:
+            timing = self.timings.setdefault(phase, {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'bytes': 0, 'pixels': 0})
+            timing['wall'] += wall
+            timing['cpu'] += cpu
+            timing['calls'] += 1
+            timing['bytes'] += copied
+            timing['pixels'] += pixels
+
+    def timing_finish(self, run):
+        """
+        Appends timings of the run as one JSON line to the timing log, run describes the parameters.
+        """
+        if self.timings is None:
+            return
+        path = os.environ[self.TIMING_LOG_VARIABLE]
+        run.update(wall=time.time() - self.timing_clock[0], cpu=process_time() - self.timing_clock[1],
+                   phases=self.timings, engine='numpy' if load_numpy() is not None else 'loop',
+                   pixels=sum(timing['pixels'] for timing in self.timings.values()),
+                   bytes=sum(timing['bytes'] for timing in self.timings.values()), time=time.time())
+        self.timings = None
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            self.profiler.dump_stats(path + '.prof')  # Whole profile of the last run for pstats or snakeviz
+            entries = sorted(pstats.Stats(self.profiler).stats.items(), key=lambda item: -item[1][3])
+            run['profile'] = [{'function': '%s:%d(%s)' % function, 'calls': calls, 'total': total,
+                               'cumulative': cumulative}
+                              for function, (_, calls, total, cumulative, _) in entries[:self.PROFILE_ENTRIES]]
+            self.profiler = None
+        tracemalloc = sys.modules.get('tracemalloc')
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:self.PROFILE_ENTRIES]
+            tracemalloc.stop()
+            run['memory'] = {'current': current, 'peak': peak,
+                             'top': [{'line': str(statistic.traceback), 'size': statistic.size,
+                                      'count': statistic.count} for statistic in statistics]}
+        with open(path, 'a') as log:
+            import json
+            log.write(json.dumps(run, sort_keys=True) + '\n')
+
+    def convolute_file(self, input_path, output_path, kernel_name, color_mode, reporter=None):
+        """
+        Detects edges in PNG, PPM or PGM image and writes the result to output path.
+        Rows are decoded once and encoded as bands are computed, so only the bands in progress
+        and rows used by wrap around at the edges of the image are held in memory.
+        Top bands read the bottom rows, so they are computed last and rows below them wait in temporary file.
+        Returns False and removes the output, if computation was cancelled through reporter.
+        """
+        image = open_image(input_path)
+        kernel_x, kernel_y = self.kernels_x[kernel_name], self.kernels_y[kernel_name]
+        left, right, top, bottom = self.block_halo(kernel_x, color_mode)
+        band_height = max(1, self.band_height or self.tile_size()[1])
+        blocks = [(0, image.width, start, end) for start, end in self.split_bands(0, image.height)]
+        wrapped = [block for block in blocks if block[2] < top]  # Bands reading the bottom rows by wrap around
+        deferred = 0
+        if wrapped and len(wrapped) < len(blocks):  # They are computed after the bottom rows are decoded
+            blocks = blocks[len(wrapped):] + wrapped
+            deferred = wrapped[-1][3]
+        source = RowStream(image, band_height + top + bottom, max(bottom, deferred + bottom), top)
+        sink = RowSink(create_image(output_path, image.width, image.height, image.bpp), deferred)
+        completed = False
+        try:
+            completed = self.convolute_blocks(source.read, sink.write, image.width, image.height, image.bpp,
+                                              kernel_x, kernel_y, color_mode, blocks, reporter)
+        finally:
+            sink.close()
+            if not completed:  # Incomplete image is not left behind
+                os.remove(output_path)
+        return completed
+
+
+class PnmImage(object):
+    """
+    Binary PPM (P6) or PGM (P5) image with 8 bits per channel, read row by row.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as image_file:
+            magic = image_file.read(2)
+            if magic not in (b'P5', b'P6'):
+                raise ValueError("%s is not binary PPM or PGM image" % path)
+            values = []
+            while len(values) < 3:  # Width, height and maximum value separated by whitespace and comments
+                token = b''
+                character = image_file.read(1)
+                while character.isspace() or character == b'#':
+                    if character == b'#':
+                        image_file.readline()
+                    character = image_file.read(1)
+                while character and not character.isspace():
+                    token += character
+                    character = image_file.read(1)
+                values.append(int(token))
+            self.offset = image_file.tell()  # One whitespace character after maximum value is already read
+        self.width, self.height, maximum = values
+        if maximum != 255:
+            raise ValueError("%s has maximum value %d, only 255 is supported" % (path, maximum))
+        self.bpp = 1 if magic == b'P5' else 3
+
+    def rows(self, start=0):
+        """
+        Yields rows of pixels from start row to the bottom.
+        """
+        rowstride = self.width * self.bpp
+        with open(self.path, 'rb') as image_file:
+            image_file.seek(self.offset + start * rowstride)
+            for _ in range(start, self.height):
+                yield image_file.read(rowstride)
+
+
+class PngImage(object):
+    """
+    Non-interlaced PNG image with 8 bits per channel, decoded row by row.
+    """
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    CHANNELS = {0: 1, 4: 2, 2: 3, 6: 4}  # Bytes per pixel of gray, gray with alpha, RGB and RGBA color types
+    UNFILTER_BYTES = 16 * 1024 * 1024  # Memory for rows unfiltered at once with NumPy
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as image_file:
+            if image_file.read(8) != self.SIGNATURE:
+                raise ValueError("%s is not PNG image" % path)
+            chunk_type, data = next(self.chunks(image_file))
+        self.width, self.height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', data)
+        if chunk_type != b'IHDR' or depth != 8 or color_type not in self.CHANNELS or interlace != 0:
+            raise ValueError("%s is not supported, only non-interlaced 8-bit gray and RGB images "
+                             "with or without alpha are" % path)
+        self.bpp = self.CHANNELS[color_type]
+
+    def chunks(self, image_file):
+        """
+        Yields type and data of chunks.
+        """
+        while True:
+            header = image_file.read(8)
+            if len(header) < 8:
+                return
+            length, chunk_type = struct.unpack('>I4s', header)
+            data = image_file.read(length)
+            image_file.read(4)  # CRC
+            yield chunk_type, data
+
+    def unfilter(self, filter_type, line, previous):
+        """
+        Reverses PNG filter of one row, previous is the row above it.
+        """
+        bpp = self.bpp
+        row = bytearray(line)
+        if filter_type == 1:  # Sub
+            for i in range(bpp, len(row)):
+                row[i] = (row[i] + row[i - bpp]) & 0xff
+        elif filter_type == 2:  # Up
+            for i in range(len(row)):
+                row[i] = (row[i] + previous[i]) & 0xff
+        elif filter_type == 3:  # Average
+            for i in range(len(row)):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xff
+        elif filter_type == 4:  # Paeth
+            for i in range(len(row)):
+                left = row[i - bpp] if i >= bpp else 0
+                upper_left = previous[i - bpp] if i >= bpp else 0
+                estimate = left + previous[i] - upper_left
+                distance_left, distance_up = abs(estimate - left), abs(estimate - previous[i])
+                distance_upper_left = abs(estimate - upper_left)
+                if distance_left <= distance_up and distance_left <= distance_upper_left:
+                    predictor = left
+                elif distance_up <= distance_upper_left:
+                    predictor = previous[i]
+                else:
+                    predictor = upper_left
+                row[i] = (row[i] + predictor) & 0xff
+        return row
+
+    def unfilter_numpy(self, lines, count, previous):
+        """
+        Reverses PNG filters of count lines (filter type and filtered row) with NumPy, previous is the row above them
+        (array of width x bpp). Returns array of unfiltered rows.
+        Filters refer only to pixels on the left and above, so pixels on one anti-diagonal of the lines do not
+        depend on each other. Lines are skewed by one pixel per row, anti-diagonals become columns computed at once.
+        """
+        width, bpp = self.width, self.bpp
+        lines = numpy.frombuffer(lines, numpy.uint8).reshape(count, width * bpp + 1)
+        types, filtered = lines[:, 0], lines[:, 1:].reshape(count, width, bpp)
+        rows = numpy.empty((count, width, bpp), numpy.uint8)
+        if (types < 3).all():  # None, Sub and Up are computed row by row, uint8 sums wrap around like filters
+            above = previous
+            for y in range(count):
+                if types[y] == 1:
+                    numpy.cumsum(filtered[y], axis=0, dtype=numpy.uint8, out=rows[y])
+                elif types[y] == 2:
+                    numpy.add(filtered[y], above, out=rows[y])
+                else:
+                    rows[y] = filtered[y]
+                above = rows[y]
+            return rows
+        skewed = numpy.zeros((width + count + 1, count + 1, bpp), numpy.int16)  # Columns of lines, line 0 is previous
+        raw = numpy.zeros(skewed.shape, numpy.uint8)
+        skewed[1:width + 1, 0] = previous
+        for y in range(count):  # Pixel x of line y is in column x + y + 2, column y + 1 is zero pixel on the left
+            raw[y + 2:y + 2 + width, y + 1] = filtered[y]
+        kinds = types.reshape(count, 1)
+        use_left = -((kinds == 1) | (kinds == 3)).astype(numpy.int16)  # All bits set, where the filter uses it
+        use_above = -((kinds == 2) | (kinds == 3)).astype(numpy.int16)
+        halve = (kinds == 3).astype(numpy.int16)
+        paeth = kinds == 4
+        any_paeth = paeth.any()
+        for column in range(2, width + count + 1):
+            first, last = max(0, column - width - 1), min(count, column - 1)  # Lines with a pixel in the column
+            left = skewed[column - 1, first + 1:last + 1]
+            above = skewed[column - 1, first:last]
+            predictor = ((left & use_left[first:last]) + (above & use_above[first:last])) >> halve[first:last]
+            if any_paeth:  # Nearest of left, above and upper left to left + above - upper left
+                upper_left = skewed[column - 2, first:last]
+                to_above, to_left = above - upper_left, left - upper_left
+                distance_left, distance_above = numpy.abs(to_above), numpy.abs(to_left)
+                distance_upper_left = numpy.abs(to_above + to_left)
+                nearest = numpy.where((distance_left <= distance_above) & (distance_left <= distance_upper_left), left,
+                                      numpy.where(distance_above <= distance_upper_left, above, upper_left))
+                predictor = numpy.where(paeth[first:last], nearest, predictor)
+            skewed[column, first + 1:last + 1] = (raw[column, first + 1:last + 1] + predictor) & 0xff
+        for y in range(count):
+            rows[y] = skewed[y + 2:y + 2 + width, y + 1]
+        return rows
+
+    def rows(self, start=0):
+        """
+        Yields rows of pixels from start row to the bottom. Rows above start are decoded too,
+        as filters refer to previous rows. With NumPy, rows are unfiltered in batches of about UNFILTER_BYTES.
+        """
+        rowstride = self.width * self.bpp
+        batch = max(2, min(self.width, self.UNFILTER_BYTES // (6 * rowstride))) if load_numpy() is not None else 1
+        decompressor = zlib.decompressobj()
+        previous = bytearray(rowstride) if batch == 1 else numpy.zeros((self.width, self.bpp), numpy.uint8)
+        buffer = bytearray()
+        y = 0
+        with open(self.path, 'rb') as image_file:
+            image_file.read(8)
+            for chunk_type, data in self.chunks(image_file):
+                if chunk_type == b'IEND':
+                    break
+                if chunk_type != b'IDAT':
+                    continue
+                buffer += decompressor.decompress(data)
+                count = min(len(buffer) // (rowstride + 1), self.height - y)  # Every row starts with filter type
+                if count < batch and y + count < self.height:
+                    continue
+                if batch == 1:
+                    rows = []
+                    for index in range(count):
+                        offset = index * (rowstride + 1)
+                        previous = self.unfilter(buffer[offset], buffer[offset + 1:offset + rowstride + 1], previous)
+                        rows.append(bytes(previous))
+                else:
+                    unfiltered = self.unfilter_numpy(bytes(buffer[:count * (rowstride + 1)]), count, previous)
+                    rows = [row.tobytes() for row in unfiltered]
+                    previous = unfiltered[-1] if count else previous
+                del buffer[:count * (rowstride + 1)]
+                for row in rows:
+                    if y >= start:
+                        yield row
+                    y += 1
+
+
+class PnmWriter(object):
+    """
+    Writes binary PPM or PGM image row by row.
+    """
+    def __init__(self, path, width, height, bpp):
+        if bpp not in (1, 3):
+            raise ValueError("PPM and PGM images have no alpha, use PNG for output")
+        self.image_file = open(path, 'wb')
+        self.image_file.write(b'%s\n%d %d\n255\n' % (b'P5' if bpp == 1 else b'P6', width, height))
+
+    def write_row(self, row):
+        self.image_file.write(row)
+
+    def close(self):
+        self.image_file.close()
+
+
+class PngWriter(object):
+    """
+    Writes PNG image row by row, rows are compressed without filters.
+    """
+    COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}  # Color types of gray, gray with alpha, RGB and RGBA
+
+    def __init__(self, path, width, height, bpp):
+        self.image_file = open(path, 'wb')
+        self.image_file.write(PngImage.SIGNATURE)
+        self.write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, self.COLOR_TYPES[bpp], 0, 0, 0))
+        self.compressor = zlib.compressobj()
+
+    def write_chunk(self, chunk_type, data):
+        self.image_file.write(struct.pack('>I', len(data)) + chunk_type + data)
+        self.image_file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def write_row(self, row):
+        data = self.compressor.compress(b'\0' + bytes(row))  # Filter type None
+        if data:
+            self.write_chunk(b'IDAT', data)
+
+    def close(self):
+        self.write_chunk(b'IDAT', self.compressor.flush())
+        self.write_chunk(b'IEND', b'')
+        self.image_file.close()
+
+
+def open_image(path):
+    """
+    Opens PNG, PPM or PGM image for reading by its signature.
+    """
+    with open(path, 'rb') as image_file:
+        signature = image_file.read(8)
+    if signature == PngImage.SIGNATURE:
+        return PngImage(path)
+    return PnmImage(path)
+
+
+def create_image(path, width, height, bpp):
+    """
+    Creates PNG, PPM or PGM image for writing by extension of the path.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.png':
+        return PngWriter(path, width, height, bpp)
+    if extension in ('.ppm', '.pgm', '.pnm'):
+        return PnmWriter(path, width, height, bpp)
+    raise ValueError("Unsupported output format %s, use .png, .ppm or .pgm" % extension)
+
+
+class RowStream(object):
+    """
+    Serves rows of image decoded from top to bottom to read_block.
+    Only the last window rows, head rows at the top and tail rows at the bottom of the image are held in memory.
+    Head and tail are kept for wrap around, tail rows are read only after the stream has passed them.
+    """
+    def __init__(self, image, window, head, tail):
+        self.image = image
+        self.rows = image.rows()
+        self.next_row = 0
+        self.window = collections.deque(maxlen=window)
+        self.head = []
+        self.head_rows = head
+        self.tail = []
+        self.tail_start = max(0, image.height - tail)
+
+    def row(self, y):
+        """
+        Returns row y, rows up to it are decoded, if they were not yet.
+        """
+        while self.next_row <= y:
+            row = next(self.rows)
+            self.window.append(row)
+            if self.next_row < self.head_rows:
+                self.head.append(row)
+            if self.next_row >= self.tail_start:
+                self.tail.append(row)
+            self.next_row += 1
+        if y < len(self.head):
+            return self.head[y]
+        if y >= self.tail_start:
+            return self.tail[y - self.tail_start]
+        return self.window[y - self.next_row + len(self.window)]
+
+    def read(self, x_start, x_end, y_start, y_end):
+        """
+        Returns pixels of the block, read callback of convolute_blocks.
+        """
+        bpp = self.image.bpp
+        return b''.join([self.row(y)[x_start * bpp:x_end * bpp] for y in range(y_start, y_end)])
+
+
+class RowSink(object):
+    """
+    Writes computed bands to image writer in order of rows. Bands computed out of order wait for the ones above them.
+    Rows below the first deferred rows are kept in temporary file, until the deferred rows are written.
+    """
+    def __init__(self, writer, deferred=0):
+        self.writer = writer
+        self.pending = {}
+        self.next_row = 0
+        self.deferred = deferred
+        self.spooled = deferred  # Rows from deferred to spooled are in temporary file
+        self.spool = None
+        if deferred:
+            import tempfile  # Imported on first use, so the command line starts without it
+            self.spool = tempfile.TemporaryFile()
+
+    def write_rows(self, pixels, rows):
+        """
+        Writes pixels of rows to image writer. Returns length of one row.
+        """
+        rowstride = len(pixels) // rows
+        for y in range(rows):
+            self.writer.write_row(pixels[y * rowstride:(y + 1) * rowstride])
+        return rowstride
+
+    def write(self, x_start, x_end, y_start, y_end, pixels):
+        """
+        Write callback of convolute_blocks, blocks span whole rows.
+        """
+        self.pending[y_start] = (y_end, pixels)
+        while self.spool is not None and self.spooled in self.pending:
+            y_end, pixels = self.pending.pop(self.spooled)
+            self.spool.write(pixels)
+            self.spooled = y_end
+        while self.next_row in self.pending:
+            y_end, pixels = self.pending.pop(self.next_row)
+            rowstride = self.write_rows(pixels, y_end - self.next_row)
+            self.next_row = y_end
+            if self.spool is not None and self.next_row == self.deferred:  # Spooled rows follow the deferred ones
+                self.spool.seek(0)
+                for row in iter(lambda: self.spool.read(rowstride), b''):
+                    self.writer.write_row(row)
+                self.spool.close()
+                self.spool = None
+                self.next_row = self.spooled
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
+        self.writer.close()
+
+
+def main(argv=None):
+    """
+    Command line entry point, detects edges in image file without GIMP.
+    """
+    import argparse
+    import signal
+    core = ConvolutionCore()
+    parser = argparse.ArgumentParser(description="Edge detection of PNG, PPM and PGM images without GIMP.")
+    parser.add_argument("input", help="Path of input image")
+    parser.add_argument("output", help="Path of output image, format is chosen by extension (.png, .ppm, .pgm)")
+    parser.add_argument("--kernel", default="Sobel", help="Kernel: %s or Custom" % ", ".join(sorted(core.kernels_x)))
+    parser.add_argument("--kernel-spec", default="", help="Custom kernel, e.g. '1 0 -1; 2 0 -2; 1 0 -1'")
+    parser.add_argument("--display", type=int, default=0, choices=[0, 1, 2],
+                        help="0: Grayscale, 1: Red and Blue, 2: Thin edges (blur, suppression, hysteresis)")
+    parser.add_argument("--blur", type=int, default=core.edge_blur, help="Blur radius with display 2 (0: no blur)")
+    parser.add_argument("--low", type=int, default=core.edge_low,
+                        help="Gradient magnitude of weak edges with display 2")
+    parser.add_argument("--high", type=int, default=core.edge_high,
+                        help="Gradient magnitude of strong edges with display 2")
+    parser.add_argument("--luma", default="Average", choices=sorted(core.LUMA_WEIGHTS), help="Grayscale weights")
+    parser.add_argument("--magnitude", default=core.magnitude_type, choices=core.MAGNITUDE_TYPES,
+                        help="Magnitude of display type 0")
+    parser.add_argument("--workers", type=int, default=0, help="Worker threads (0 uses all CPUs)")
+    parser.add_argument("--band-height", type=int, default=0, help="Rows per band (0 uses tile height)")
+    args = parser.parse_args(argv)
+
+    if args.kernel_spec:
+        core.register_kernel('Custom', *core.parse_kernel_spec(args.kernel_spec))
+    if args.kernel not in core.kernels_x:
+        parser.error("unknown kernel %s" % args.kernel)
+    if args.blur < 0:
+        parser.error("blur radius must not be negative")
+    core.luma_type = args.luma
+    core.magnitude_type = args.magnitude
+    core.workers = args.workers
+    core.band_height = args.band_height
+    core.edge_blur, core.edge_low, core.edge_high = args.blur, args.low, args.high
+    interrupted = []
+    def show(progress):
+        sys.stderr.write("\r%3d %%" % int(progress * 100))
+        sys.stderr.flush()
+    reporter = ProgressReporter(show if sys.stderr.isatty() else None, lambda: interrupted, core.PROGRESS_RATE)
+    start_time = time.time()
+    # Ctrl+C stops after current bands, handler of the caller is restored, when main is called in process
+    previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: interrupted.append(signum))
+    try:
+        completed = core.convolute_file(args.input, args.output, args.kernel, args.display, reporter)
+    except (IOError, OSError, ValueError) as e:
+        parser.exit(1, "%s: error: %s\n" % (parser.prog, e))
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    if completed:
+        reporter.finish()
+    if sys.stderr.isatty():
+        sys.stderr.write("\n")
+    if not completed:
+        parser.exit(130, "%s: cancelled\n" % parser.prog)
+    print("Edges of %s saved to %s in %.2f s" % (args.input, args.output, time.time() - start_time))
+
+if __name__ == '__main__':
+    main()
@@ -14,52 +14,645 @@ bl_info = {
     "category": "Animation",
 }
 
+import os
+import math
+import time
+import tempfile
+import traceback
+import subprocess
+import numpy
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import bpy
-from bpy.props import FloatVectorProperty, PointerProperty, IntProperty
+from bpy.app.handlers import persistent
+from bpy.props import (FloatVectorProperty, PointerProperty, IntProperty, EnumProperty, FloatProperty,
+                       StringProperty, BoolProperty)
+
+BLADES_MODIFIER = "Grass Blades"  # Name of Geometry Nodes modifier, that scatters instanced blades
+wind_caches = {}  # Wind caches mapped from disk by their paths, with modification times
+CACHE_DTYPE = numpy.float32  # Positions are in world space, float16 would move grass far from the origin
+UPDATE_DELAY = 0.25  # Seconds without property change, after which queued updates are applied
+pending_updates = {}  # Functions applying property changes, each is queued once however many times it changed
+update_time = 0.0  # Time of the last property change
 
 # Parameters-update functions:
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def update_grass_color(self, context):
+def queue_update(apply, context):
+    """
+    Queues function applying property change to the scene. Queued functions are called once by a timer,
+    when no property has changed for UPDATE_DELAY, so values passed while dragging a slider are skipped.
+    Without user interface (background mode) timers do not run, so the function is called at once.
+    """
+    global update_time
+    if bpy.app.background:
+        apply(context.scene)
+        return
+    pending_updates[apply] = True
+    update_time = time.monotonic()
+    if not bpy.app.timers.is_registered(apply_updates):
+        bpy.app.timers.register(apply_updates, first_interval=UPDATE_DELAY)
+
+def apply_updates():
+    """
+    Timer that calls queued functions once values have settled, returns delay of the next check
+    """
+    remaining = update_time + UPDATE_DELAY - time.monotonic()
+    if remaining > 0:
+        return remaining
+    scene = bpy.context.scene
+    while pending_updates:
+        apply = pending_updates.popitem()[0]
+        try:
+            apply(scene)
+        except Exception:  # Failed update is reported, the others are still applied and the timer keeps working
+            traceback.print_exc()
+    return None
+
+def debounced(apply):
+    """
+    Returns update callback of property, that queues apply(scene)
+    """
+    def update(self, context):
+        queue_update(apply, context)
+    return update
+
+def update_grass_color(scene):
     """
     Updates grass color
     """
-    grass_object = context.scene.grass_object
-    grass_material_index = grass_object.particle_systems[0].settings.material - 1
+    grass_object = scene.grass_object
+    if grass_object is None:
+        return
+    if grass_object.particle_systems:
+        grass_material_index = grass_object.particle_systems[0].settings.material - 1
+    else:  # Blades use the second material of the ground
+        grass_material_index = 1
     grass_material = grass_object.data.materials[grass_material_index]
     bsdf = grass_material.node_tree.nodes.get("Principled BSDF")
-    bsdf.inputs["Base Color"].default_value = self.grass_color
+    bsdf.inputs["Base Color"].default_value = scene.grass_props.grass_color
 
-def update_ground_color(self, context):
+def update_ground_color(scene):
     """
     Updates ground color
     """
-    obj = bpy.context.active_object
-    mat = obj.data.materials[0]
-    mat.node_tree.nodes["Principled BSDF"].inputs["Base Color"].default_value = self.ground_color
+    grass_object = scene.grass_object  # Grass grows from the ground, its first material
+    if grass_object is None:
+        return
+    mat = grass_object.data.materials[0]
+    mat.node_tree.nodes["Principled BSDF"].inputs["Base Color"].default_value = scene.grass_props.ground_color
 
-def update_density(self, context):
+def update_density(scene):
+    """
+    Updates count of grass particles, they are distributed again
     """
-    Updates count of grass particles
+    grass_props = scene.grass_props
+    grass_object = scene.grass_object
+    if grass_object is not None and grass_object.particle_systems:
+        particle_settings = grass_object.particle_systems[0].settings
+        particle_settings.count = grass_props.density
+        particle_settings.display_percentage = 100
+
+def preview_density(self, context):
+    """
+    Shows part of existing grass particles while density is dragged, that is cheap compared to distributing them.
+    Count is updated once density has settled.
     """
-    grass_props = context.scene.grass_props
     grass_object = context.scene.grass_object
-    particle_settings = grass_object.particle_systems[0].settings
-    particle_settings.count = grass_props.density
+    if grass_object is not None and grass_object.particle_systems:
+        particle_settings = grass_object.particle_systems[0].settings
+        percentage = round(100 * self.density / particle_settings.count)
+        particle_settings.display_percentage = max(1, min(100, percentage))  # Proxy can not show more particles
+    queue_update(update_density, context)
 
-def update_strength(self, context):
+def update_blades(scene):
     """
-    Updates wind strength
+    Updates count of instanced blades
+    """
+    grass_object = scene.grass_object
+    if grass_object is not None:
+        set_blades_value(grass_object, "Density", scene.grass_props.blades / mesh_area(grass_object.data))
+
+def update_viewport_display(scene):
+    """
+    Updates part of instanced blades shown in viewport
     """
-    wind_props = context.scene.wind_props
-    context.scene.wind_object.field.strength = wind_props.strength
-    context.scene.turbulence_object.field.strength = wind_props.strength * 2
+    set_blades_value(scene.grass_object, "Viewport Display", scene.grass_props.viewport_display / 100)
 
-def update_direction(self, context):
+def update_strength(scene):
+    """
+    Updates wind strength
+    """
+    wind_props = scene.wind_props
+    if scene.wind_object is not None:
+        scene.wind_object.field.strength = wind_props.strength
+    if scene.turbulence_object is not None:
+        scene.turbulence_object.field.strength = wind_props.strength * 2
+    set_blades_value(scene.grass_object, "Wind Strength", wind_props.strength)
+
+def update_direction(scene):
     """
     Updates wind direction
     """
-    context.scene.wind_object.rotation_euler[2] = context.scene.wind_props.direction
+    if scene.wind_object is not None:
+        scene.wind_object.rotation_euler[2] = scene.wind_props.direction
+    set_blades_value(scene.grass_object, "Wind Direction", scene.wind_props.direction)
+
+def update_use_cache(self, context):
+    """
+    Switches between simulated grass and grass played from wind cache
+    """
+    show_cache(context.scene, self.use_cache)
+
+# Scene construction functions:
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Data-blocks are created directly through bpy.data, so no operator, undo push or UI context is involved.
+
+def create_material(name, color):
+    """
+    Creates node material with given base color
+    """
+    material = bpy.data.materials.new(name)
+    material.use_nodes = True
+    bsdf = material.node_tree.nodes.get("Principled BSDF")
+    bsdf.inputs["Base Color"].default_value = color
+    return material
+
+def create_ground_mesh(size=2.0):
+    """
+    Creates square plane mesh lying on XY plane, same as the plane primitive
+    """
+    half = size / 2
+    mesh = bpy.data.meshes.new("Plane")
+    mesh.from_pydata([(-half, -half, 0), (half, -half, 0), (half, half, 0), (-half, half, 0)], [], [(0, 1, 2, 3)])
+    uv_layer = mesh.uv_layers.new(name="UVMap")
+    uv_layer.data.foreach_set("uv", (0.0, 0.0, 1.0, 0.0, 1.0, 1.0, 0.0, 1.0))
+    mesh.update()
+    return mesh
+
+def create_grass_settings(density, material):
+    """
+    Creates hair particle settings of grass, material is index of material slot starting from 1
+    """
+    particles = bpy.data.particles.new("ParticleSettings")
+    particles.type = 'HAIR'
+    particles.hair_length = 1.0
+    particles.use_advanced_hair = True
+    particles.child_type = 'INTERPOLATED'
+    particles.count = density
+    particles.clump_factor = -0.3
+    particles.roughness_1 = 0.2
+    particles.tip_radius = 0.005
+    particles.brownian_factor = 0.1
+    particles.material = material
+    return particles
+
+def create_blade_mesh(height=1.0, width=0.02):
+    """
+    Creates mesh of one grass blade, tapered and bent along X axis, that is shared by all instances
+    """
+    mesh = bpy.data.meshes.new("Grass Blade")
+    mesh.from_pydata([(-width, 0, 0), (width, 0, 0), (-width * 0.6, 0, height * 0.5), (width * 0.6, 0, height * 0.5),
+                      (0.05 * height, 0, height)], [], [(0, 1, 3, 2), (2, 3, 4)])
+    mesh.update()
+    return mesh
+
+def mesh_area(mesh):
+    """
+    Returns area of all faces of mesh
+    """
+    return sum(polygon.area for polygon in mesh.polygons) or 1.0
+
+def new_group_socket(node_group, name, in_out, socket_type):
+    """
+    Adds input or output socket to node group, with interface of Blender 4 or inputs and outputs of Blender 3
+    """
+    if hasattr(node_group, "interface"):
+        return node_group.interface.new_socket(name, in_out=in_out, socket_type=socket_type)
+    sockets = node_group.inputs if in_out == 'INPUT' else node_group.outputs
+    return sockets.new(socket_type, name)
+
+def create_blades_node_group(blade_object, density, viewport_display):
+    """
+    Creates Geometry Nodes group, that scatters instances of blade object on faces of the ground.
+    Parameters are Value nodes named Density, Viewport Display, Wind Strength and Wind Direction,
+    so all fields sharing the group are changed at once. Blades lean along wind direction with noise, that moves in time.
+    """
+    node_group = bpy.data.node_groups.new("Grass Blades", 'GeometryNodeTree')
+    new_group_socket(node_group, "Geometry", 'INPUT', 'NodeSocketGeometry')
+    new_group_socket(node_group, "Geometry", 'OUTPUT', 'NodeSocketGeometry')
+    nodes, links = node_group.nodes, node_group.links
+
+    def value_node(name, value):
+        node = nodes.new('ShaderNodeValue')
+        node.name = node.label = name
+        node.outputs[0].default_value = value
+        return node
+
+    def math_node(operation, *inputs):
+        node = nodes.new('ShaderNodeMath')
+        node.operation = operation
+        for index, value in enumerate(inputs):
+            if isinstance(value, bpy.types.NodeSocket):
+                links.new(value, node.inputs[index])
+            else:
+                node.inputs[index].default_value = value
+        return node.outputs[0]
+
+    group_input = nodes.new('NodeGroupInput')
+    group_output = nodes.new('NodeGroupOutput')
+    density_value = value_node("Density", density)
+    display_value = value_node("Viewport Display", viewport_display)
+    strength_value = value_node("Wind Strength", 0.0)
+    direction_value = value_node("Wind Direction", 0.0)
+
+    # Only part of blades is distributed in viewport: density * (1 + is_viewport * (display - 1))
+    is_viewport = nodes.new('GeometryNodeIsViewport')
+    display_factor = math_node('MULTIPLY_ADD', is_viewport.outputs[0],
+                               math_node('SUBTRACT', display_value.outputs[0], 1.0), 1.0)
+    distribute = nodes.new('GeometryNodeDistributePointsOnFaces')
+    distribute.distribute_method = 'RANDOM'
+    links.new(group_input.outputs[0], distribute.inputs["Mesh"])
+    links.new(math_node('MULTIPLY', density_value.outputs[0], display_factor), distribute.inputs["Density"])
+
+    # Instances of the shared blade with random rotation around Z axis and random size
+    object_info = nodes.new('GeometryNodeObjectInfo')
+    object_info.inputs["Object"].default_value = blade_object
+    rotation = nodes.new('FunctionNodeRandomValue')
+    rotation.data_type = 'FLOAT_VECTOR'
+    rotation.inputs[1].default_value = (0.0, 0.0, 2 * math.pi)  # Max of vector values
+    scale = nodes.new('FunctionNodeRandomValue')
+    scale.data_type = 'FLOAT'
+    scale.inputs[2].default_value = 0.6  # Min and max of float values
+    scale.inputs[3].default_value = 1.2
+    instance = nodes.new('GeometryNodeInstanceOnPoints')
+    links.new(distribute.outputs["Points"], instance.inputs["Points"])
+    links.new(object_info.outputs["Geometry"], instance.inputs["Instance"])
+    links.new(rotation.outputs[0], instance.inputs["Rotation"])
+    links.new(scale.outputs[1], instance.inputs["Scale"])
+
+    # Wind, blades lean around their root by noise of position and time times wind strength
+    position = nodes.new('GeometryNodeInputPosition')
+    scene_time = nodes.new('GeometryNodeInputSceneTime')
+    time_offset = nodes.new('ShaderNodeCombineXYZ')
+    links.new(scene_time.outputs["Seconds"], time_offset.inputs[0])
+    moving_position = nodes.new('ShaderNodeVectorMath')
+    moving_position.operation = 'ADD'
+    links.new(position.outputs[0], moving_position.inputs[0])
+    links.new(time_offset.outputs[0], moving_position.inputs[1])
+    noise = nodes.new('ShaderNodeTexNoise')
+    noise.inputs["Scale"].default_value = 2.0
+    links.new(moving_position.outputs[0], noise.inputs["Vector"])
+    lean = nodes.new('ShaderNodeCombineXYZ')
+    links.new(math_node('MULTIPLY', math_node('MULTIPLY', noise.outputs["Fac"], strength_value.outputs[0]), 0.8),
+              lean.inputs[1])
+    links.new(direction_value.outputs[0], lean.inputs[2])
+    rotate = nodes.new('GeometryNodeRotateInstances')
+    rotate.inputs["Local Space"].default_value = False
+    links.new(instance.outputs["Instances"], rotate.inputs["Instances"])
+    links.new(lean.outputs[0], rotate.inputs["Rotation"])
+    links.new(position.outputs[0], rotate.inputs["Pivot Point"])
+
+    join = nodes.new('GeometryNodeJoinGeometry')
+    links.new(group_input.outputs[0], join.inputs[0])
+    links.new(rotate.outputs["Instances"], join.inputs[0])
+    links.new(join.outputs[0], group_output.inputs[0])
+    return node_group
+
+def blades_node_group(grass_object):
+    """
+    Returns Geometry Nodes group of grass object, None for grass made of hair particles
+    """
+    modifier = grass_object.modifiers.get(BLADES_MODIFIER) if grass_object is not None else None
+    return modifier.node_group if modifier is not None else None
+
+def set_blades_value(grass_object, name, value):
+    """
+    Sets parameter of instanced blades, nothing is done for grass made of hair particles
+    """
+    node_group = blades_node_group(grass_object)
+    if node_group is not None:
+        node_group.nodes[name].outputs[0].default_value = value
+
+def create_grass_field(collection, mesh, particles, location=(0, 0, 0)):
+    """
+    Creates ground object from mesh with particle system of given settings and links it to collection.
+    Particles can also be Geometry Nodes group, that scatters blades.
+    """
+    ground_object = bpy.data.objects.new("Plane", mesh)
+    ground_object.location = location
+    collection.objects.link(ground_object)
+    if isinstance(particles, bpy.types.NodeTree):
+        modifier = ground_object.modifiers.new(BLADES_MODIFIER, 'NODES')
+        default_group = modifier.node_group  # Some versions create empty group together with the modifier
+        modifier.node_group = particles
+        if default_group is not None and default_group.users == 0:
+            bpy.data.node_groups.remove(default_group)
+        return ground_object
+    particle_system = ground_object.modifiers.new("ParticleSettings", 'PARTICLE_SYSTEM').particle_system
+    default_particles = particle_system.settings  # Created together with the modifier
+    particle_system.settings = particles
+    if default_particles is not None and default_particles.users == 0:
+        bpy.data.particles.remove(default_particles)
+    return ground_object
+
+def create_grass_fields(scene, locations, collection=None, view_layer=None):
+    """
+    Creates grass field at every location with current grass properties of the scene.
+    Fields share one ground mesh, materials and particle settings (or blades), so colors and density are changed
+    for all of them. Scene is evaluated once, after all fields are created. Returns list of ground objects.
+    """
+    grass_props = scene.grass_props
+    collection = collection or scene.collection
+    mesh = create_ground_mesh()
+    mesh.materials.append(create_material("Ground Material", grass_props.ground_color))
+    grass_material = create_material("Grass Material", grass_props.grass_color)
+    mesh.materials.append(grass_material)
+    if grass_props.backend == 'GEOMETRY_NODES':
+        blade_mesh = create_blade_mesh()
+        blade_mesh.materials.append(grass_material)
+        blade_object = bpy.data.objects.new("Grass Blade", blade_mesh)
+        collection.objects.link(blade_object)  # Hidden source of instances
+        blade_object.hide_viewport = blade_object.hide_render = True
+        particles = create_blades_node_group(blade_object, grass_props.blades / mesh_area(mesh),
+                                             grass_props.viewport_display / 100)
+    else:
+        particles = create_grass_settings(grass_props.density, len(mesh.materials))
+
+    ground_objects = [create_grass_field(collection, mesh, particles, location) for location in locations]
+    if ground_objects:
+        scene.grass_object = ground_objects[-1]
+        if scene.wind_object is not None:  # Blades start at 0, they sway with existing wind at once
+            set_blades_value(scene.grass_object, "Wind Strength", scene.wind_props.strength)
+            set_blades_value(scene.grass_object, "Wind Direction", scene.wind_props.direction)
+    (view_layer or scene.view_layers[0]).update()
+    return ground_objects
+
+def create_effector(collection, name, field_type, location, radius=1.0):
+    """
+    Creates empty object with force field and links it to collection
+    """
+    effector_object = bpy.data.objects.new(name, None)
+    effector_object.location = location
+    effector_object.empty_display_size = radius
+    effector_object.field.type = field_type  # Also sets display type of the empty
+    collection.objects.link(effector_object)
+    return effector_object
+
+def create_wind(scene, collection=None, view_layer=None):
+    """
+    Creates wind and rotating turbulence, that animate grass, with current wind properties of the scene.
+    Scene is evaluated once, after both effectors are created. Returns wind and turbulence objects.
+    """
+    wind_props = scene.wind_props
+    collection = collection or scene.collection
+
+    wind_object = create_effector(collection, "Wind", 'WIND', (0, 0, 1.5), radius=0.15)
+    wind_object.rotation_euler = (-90.0, 0.0, wind_props.direction)
+    wind_object.field.shape = 'PLANE'  # Defaults of wind added by operator
+    wind_object.field.flow = 1.0
+    scene.wind_object = wind_object
+
+    turbulence_object = create_effector(collection, "Turbulence", 'TURBULENCE', (0, 0, 0))
+    scene.turbulence_object = turbulence_object
+
+    turbulence_object.animation_data_create()
+    turbulence_object.animation_data.action = bpy.data.actions.new(name="TurbulenceRotation")
+
+    # Turbulence object rotation for grass animation
+    fcurve = turbulence_object.animation_data.action.fcurves.new(data_path="rotation_euler", index=0)
+    fcurve.keyframe_points.add(count=2)
+    fcurve.keyframe_points[0].co = (0, 0)
+    fcurve.keyframe_points[1].co = (250, 9.28)
+    fcurve.update()
+
+    scene.frame_start = 1
+    scene.frame_end = 250
+    set_blades_value(scene.grass_object, "Wind Strength", wind_props.strength)
+    set_blades_value(scene.grass_object, "Wind Direction", wind_props.direction)
+    (view_layer or scene.view_layers[0]).update()
+    return wind_object, turbulence_object
+
+def make_active(context, active_object):
+    """
+    Selects only the given object and makes it active, same as objects added by operators
+    """
+    for selected_object in context.selected_objects:
+        selected_object.select_set(False)
+    active_object.select_set(True)
+    context.view_layer.objects.active = active_object
+
+# Wind cache functions:
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Cache is NumPy array (frames, strands, steps, 3) of float32 positions in world space, saved as .npy file.
+# Evaluated hair paths are available only through co_hair, frames are played with foreach_set of mesh vertices.
+
+def read_strands(grass_object, depsgraph):
+    """
+    Returns positions of evaluated hair strands (parents and children) as array (strands, steps, 3)
+    """
+    evaluated_object = grass_object.evaluated_get(depsgraph)
+    particle_system = evaluated_object.particle_systems[0]
+    steps = 2 ** particle_system.settings.display_step + 1
+    strands = len(particle_system.particles) + len(particle_system.child_particles)
+    co_hair = particle_system.co_hair
+    positions = numpy.array([co_hair(evaluated_object, particle_no=strand, step=step)
+                             for strand in range(strands) for step in range(steps)], dtype=numpy.float32)
+    return positions.reshape(strands, steps, 3)
+
+def bake_wind(scene, depsgraph, path, frame_start, frame_end, window_manager=None):
+    """
+    Evaluates grass animation once for every frame from frame_start to frame_end and saves strands to path.
+    With hair dynamics, frames are simulated in order, so earlier frames are evaluated too, but not saved.
+    Without them, every frame depends only on time and the range is evaluated alone. Returns the cache.
+    """
+    if frame_end < frame_start:
+        raise ValueError("Frame range %d-%d is empty, last frame must not be before the first one"
+                         % (frame_start, frame_end))
+    grass_object = scene.grass_object
+    show_cache(scene, False)
+    wind_caches.pop(path, None)  # Mapped file can not be overwritten on some systems
+    if grass_object.particle_systems[0].use_hair_dynamics:
+        for frame in range(scene.frame_start, frame_start):  # Simulation state is built from the first frame
+            scene.frame_set(frame)
+    cache = None
+    if window_manager is not None:
+        window_manager.progress_begin(frame_start, frame_end)
+    for frame in range(frame_start, frame_end + 1):
+        scene.frame_set(frame)
+        positions = read_strands(grass_object, depsgraph)
+        if cache is None:
+            cache = numpy.lib.format.open_memmap(path, mode='w+', dtype=CACHE_DTYPE,
+                                                 shape=(frame_end - frame_start + 1,) + positions.shape)
+        cache[frame - frame_start] = positions
+        if window_manager is not None:
+            window_manager.progress_update(frame)
+    if window_manager is not None:
+        window_manager.progress_end()
+    cache.flush()
+    return cache
+
+def bake_wind_chunk(frame_start, frame_end, path):
+    """
+    Bakes frames of the current scene to path, called in background worker processes
+    """
+    scene = bpy.context.scene
+    bake_wind(scene, bpy.context.evaluated_depsgraph_get(), path, frame_start, frame_end)
+
+def split_frames(frame_start, frame_end, chunks):
+    """
+    Splits frame range into at most given number of chunks (start, end) of nearly equal length
+    """
+    frames = frame_end - frame_start + 1
+    chunks = max(1, min(chunks, frames))
+    bounds = [frame_start + frames * index // chunks for index in range(chunks + 1)]
+    return [(start, end - 1) for start, end in zip(bounds, bounds[1:])]
+
+def merge_wind_caches(paths, path):
+    """
+    Joins chunk caches in frame order into one cache at path, chunk files are removed. Returns the cache.
+    """
+    chunks = [numpy.load(chunk_path, mmap_mode='r') for chunk_path in paths]
+    wind_caches.pop(path, None)
+    cache = numpy.lib.format.open_memmap(path, mode='w+', dtype=CACHE_DTYPE,
+                                         shape=(sum(len(chunk) for chunk in chunks),) + chunks[0].shape[1:])
+    frame = 0
+    for chunk in chunks:
+        cache[frame:frame + len(chunk)] = chunk
+        frame += len(chunk)
+    cache.flush()
+    del chunks
+    for chunk_path in paths:
+        os.remove(chunk_path)
+    return cache
+
+def bake_wind_parallel(blend_path, frame_start, frame_end, path, workers=0, finished=None):
+    """
+    Bakes frame range of saved .blend file in chunks, each in its own blender --background process,
+    at most workers (0 uses all CPUs) at once. CPUs are divided among the processes.
+    finished(chunks) is called in the calling thread after every chunk. Returns the merged cache.
+    """
+    if frame_end < frame_start:  # Workers would fail to bake it, with less clear error
+        raise ValueError("Frame range %d-%d is empty, last frame must not be before the first one"
+                         % (frame_start, frame_end))
+    cpus = os.cpu_count() or 1
+    chunks = split_frames(frame_start, frame_end, workers or cpus)
+    paths = ["%s.%d-%d.npy" % (os.path.splitext(path)[0], start, end) for start, end in chunks]
+    command = [bpy.app.binary_path, "--background", blend_path, "--threads", str(max(1, cpus // len(chunks))),
+               "--python-exit-code", "1", "--python-expr"]
+
+    def bake_chunk(chunk, chunk_path):
+        expression = "import %s as grass; grass.bake_wind_chunk(%d, %d, %r)" % (__name__, chunk[0], chunk[1],
+                                                                                 chunk_path)
+        subprocess.run(command + [expression], check=True, stdout=subprocess.DEVNULL)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:  # Threads only wait for the processes
+            futures = [executor.submit(bake_chunk, chunk, chunk_path) for chunk, chunk_path in zip(chunks, paths)]
+            for count, future in enumerate(as_completed(futures), 1):
+                future.result()  # Raises error of failed worker
+                if finished is not None:
+                    finished(count)
+    except Exception:
+        for chunk_path in paths:
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+        raise
+    return merge_wind_caches(paths, path)
+
+def use_wind_cache(scene, cache, frame_start, collection=None):
+    """
+    Switches grass to baked cache starting at frame_start, mesh of baked strands is created when needed
+    """
+    scene.wind_props.cache_start = frame_start
+    baked_object = scene.baked_grass_object
+    if baked_object is not None and len(baked_object.data.vertices) != cache.shape[1] * cache.shape[2]:
+        bpy.data.objects.remove(baked_object)  # Number of strands has changed
+        baked_object = None
+    if baked_object is None:
+        scene.baked_grass_object = create_baked_grass(scene, cache, collection)
+    show_cache(scene, True)
+
+def load_wind_cache(path):
+    """
+    Returns wind cache mapped from disk, it is mapped again only when the file has changed
+    """
+    modified = os.path.getmtime(path)
+    if path not in wind_caches or wind_caches[path][0] != modified:
+        wind_caches[path] = (modified, numpy.load(path, mmap_mode='r'))
+    return wind_caches[path][1]
+
+def create_baked_grass(scene, cache, collection=None):
+    """
+    Creates mesh object with strands of the first cached frame as chains of edges.
+    Geometry Nodes turn the chains into thin tubes with grass material, so they are rendered like hair.
+    """
+    frames, strands, steps = cache.shape[:3]
+    mesh = bpy.data.meshes.new("Baked Grass")
+    mesh.vertices.add(strands * steps)
+    mesh.vertices.foreach_set("co", numpy.asarray(cache[0], dtype=numpy.float32).ravel())
+    first = numpy.arange(strands * steps).reshape(strands, steps)[:, :-1].ravel()
+    mesh.edges.add(len(first))
+    mesh.edges.foreach_set("vertices", numpy.column_stack((first, first + 1)).ravel())
+    mesh.update()
+    grass_material = scene.grass_object.data.materials[scene.grass_object.particle_systems[0].settings.material - 1]
+    mesh.materials.append(grass_material)
+
+    node_group = bpy.data.node_groups.new("Baked Grass", 'GeometryNodeTree')
+    new_group_socket(node_group, "Geometry", 'INPUT', 'NodeSocketGeometry')
+    new_group_socket(node_group, "Geometry", 'OUTPUT', 'NodeSocketGeometry')
+    nodes, links = node_group.nodes, node_group.links
+    group_input = nodes.new('NodeGroupInput')
+    group_output = nodes.new('NodeGroupOutput')
+    mesh_to_curve = nodes.new('GeometryNodeMeshToCurve')
+    profile = nodes.new('GeometryNodeCurvePrimitiveCircle')
+    profile.inputs["Resolution"].default_value = 3
+    profile.inputs["Radius"].default_value = 0.005
+    curve_to_mesh = nodes.new('GeometryNodeCurveToMesh')
+    set_material = nodes.new('GeometryNodeSetMaterial')
+    set_material.inputs["Material"].default_value = grass_material
+    links.new(group_input.outputs[0], mesh_to_curve.inputs["Mesh"])
+    links.new(mesh_to_curve.outputs["Curve"], curve_to_mesh.inputs["Curve"])
+    links.new(profile.outputs["Curve"], curve_to_mesh.inputs["Profile Curve"])
+    links.new(curve_to_mesh.outputs["Mesh"], set_material.inputs["Geometry"])
+    links.new(set_material.outputs["Geometry"], group_output.inputs[0])
+
+    baked_object = bpy.data.objects.new("Baked Grass", mesh)
+    baked_object.modifiers.new("Baked Grass", 'NODES').node_group = node_group
+    (collection or scene.collection).objects.link(baked_object)
+    return baked_object
+
+def show_cache(scene, use_cache):
+    """
+    Shows baked grass instead of simulated hair particles, or the other way around
+    """
+    grass_object, baked_object = scene.grass_object, scene.baked_grass_object
+    if grass_object is not None:
+        for modifier in grass_object.modifiers:
+            if modifier.type == 'PARTICLE_SYSTEM':
+                modifier.show_viewport = modifier.show_render = not use_cache
+    if baked_object is not None:
+        baked_object.hide_viewport = baked_object.hide_render = not use_cache
+    if scene.wind_props.use_cache != use_cache:
+        scene.wind_props.use_cache = use_cache
+
+@persistent
+def play_wind_cache(scene, depsgraph=None):
+    """
+    Sets positions of baked grass to the cached frame, frame cost does not depend on simulation
+    """
+    wind_props, baked_object = scene.wind_props, scene.baked_grass_object
+    if not wind_props.use_cache or baked_object is None:
+        return
+    path = bpy.path.abspath(wind_props.cache_path)
+    if not os.path.exists(path):
+        return
+    cache = load_wind_cache(path)
+    index = min(max(scene.frame_current - wind_props.cache_start, 0), len(cache) - 1)
+    positions = numpy.asarray(cache[index], dtype=numpy.float32).ravel()  # Not copied, unless cache is older float16
+    mesh = baked_object.data
+    if len(positions) == 3 * len(mesh.vertices):
+        mesh.vertices.foreach_set("co", positions)
+        mesh.update()
 
 # Grass handling classes:
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -76,7 +669,7 @@ class GrassProps(bpy.types.PropertyGroup):
         min = 0.0,
         max = 1.0,
         size = 4,
-        update = update_grass_color
+        update = debounced(update_grass_color)
     )
     ground_color: FloatVectorProperty(
         name = "Ground Color",
@@ -86,7 +679,7 @@ class GrassProps(bpy.types.PropertyGroup):
         min = 0.0,
         max = 1.0,
         size = 4,
-        update = update_ground_color
+        update = debounced(update_ground_color)
     )
     density: IntProperty(
         name = "Density",
@@ -94,7 +687,32 @@ class GrassProps(bpy.types.PropertyGroup):
         description = 'Changes number of grass particles',
         min = 100,
         max = 10000,
-        update = update_density
+        update = preview_density
+    )
+    backend: EnumProperty(
+        name = "Backend",
+        items = [('PARTICLES', "Hair Particles", "Every strand is hair geometry, up to 10,000 strands"),
+                 ('GEOMETRY_NODES', "Geometry Nodes", "Instances of one shared blade mesh, millions of blades")],
+        default = 'PARTICLES',
+        description = "Changes how new grass is generated"
+    )
+    blades: IntProperty(
+        name = "Blades",
+        default = 100000,
+        description = 'Changes number of instanced blades',
+        min = 1000,
+        max = 10000000,
+        soft_max = 2000000,
+        update = debounced(update_blades)
+    )
+    viewport_display: FloatProperty(
+        name = "Viewport Display",
+        subtype = 'PERCENTAGE',
+        default = 10.0,
+        description = 'Changes percentage of instanced blades shown in viewport, all of them are rendered',
+        min = 1.0,
+        max = 100.0,
+        update = debounced(update_viewport_display)
     )
 
 class GrassPanel(bpy.types.Panel):
@@ -117,7 +735,12 @@ class GrassPanel(bpy.types.Panel):
         layout.label(text="Grass Properties", icon="MOD_PARTICLES")
         layout.prop(grass_props, "ground_color")
         layout.prop(grass_props, "grass_color")
-        layout.prop(grass_props, "density")
+        layout.prop(grass_props, "backend")
+        if grass_props.backend == 'GEOMETRY_NODES':
+            layout.prop(grass_props, "blades")
+            layout.prop(grass_props, "viewport_display")
+        else:
+            layout.prop(grass_props, "density")
         layout.operator("grass.generate_grass")
 
 class GrassGenerator(bpy.types.Operator):
@@ -132,43 +755,8 @@ class GrassGenerator(bpy.types.Operator):
         """
         Method that executes grass generation process
         """
-        grass_props = context.scene.grass_props
-
-        bpy.ops.mesh.primitive_plane_add(
-            size=2.0, enter_editmode=False, align='WORLD',
-            location=(0, 0, 0), scale=(1, 1, 1)
-        )
-        ground_object = bpy.context.object
-        context.scene.grass_object = ground_object
-
-        # Usage of node system for appending materials
-        ground_material = bpy.data.materials.new("Ground Material")
-        ground_material.use_nodes = True
-        ground_bsdf = ground_material.node_tree.nodes.get("Principled BSDF")
-        ground_bsdf.inputs["Base Color"].default_value = grass_props.ground_color
-        ground_object.data.materials.append(ground_material)
-
-        bpy.ops.object.particle_system_add()
-        particle_system = ground_object.particle_systems[-1]
-        particles = particle_system.settings
-
-        # Setting particle parameters as hair type
-        particles.type = 'HAIR'
-        particles.hair_length = 1.0
-        particles.use_advanced_hair = True
-        particles.child_type = 'INTERPOLATED'
-        particles.count = grass_props.density
-        particles.clump_factor = -0.3
-        particles.roughness_1 = 0.2
-        particles.tip_radius = 0.005
-        particles.brownian_factor = 0.1
-
-        grass_material = bpy.data.materials.new("Grass Material")
-        grass_material.use_nodes = True
-        grass_bsdf = grass_material.node_tree.nodes.get("Principled BSDF")
-        grass_bsdf.inputs["Base Color"].default_value = grass_props.grass_color
-        particle_system.settings.material = len(ground_object.data.materials) + 1
-        ground_object.data.materials.append(grass_material)
+        ground_object = create_grass_fields(context.scene, [(0, 0, 0)], context.collection, context.view_layer)[0]
+        make_active(context, ground_object)
 
         self.report({'INFO'}, "Grass Object Created!")
         return {'FINISHED'}
@@ -186,14 +774,41 @@ class WindProps(bpy.types.PropertyGroup):
         description = 'Changes wind force',
         min = 0,
         max = 1,
-        update = update_strength
+        update = debounced(update_strength)
     )
 
     direction: bpy.props.FloatProperty(
         name = 'Wind direction',
         description = 'Changes wind direction',
         default = 0.0,
-        update = update_direction
+        update = debounced(update_direction)
+    )
+
+    cache_path: StringProperty(
+        name = 'Wind cache',
+        subtype = 'FILE_PATH',
+        default = '//wind_cache.npy',
+        description = 'File with baked grass animation'
+    )
+
+    cache_start: IntProperty(
+        name = 'Cache start',
+        description = 'First frame of wind cache',
+        default = 1
+    )
+
+    bake_workers: IntProperty(
+        name = 'Bake workers',
+        description = 'Number of background Blender processes baking wind in parallel (0 uses all CPUs)',
+        default = 0,
+        min = 0
+    )
+
+    use_cache: BoolProperty(
+        name = 'Play wind cache',
+        description = 'Plays baked grass from wind cache instead of simulating it',
+        default = False,
+        update = update_use_cache
     )
 
 class WindPanel(bpy.types.Panel):
@@ -217,6 +832,11 @@ class WindPanel(bpy.types.Panel):
         layout.prop(wind_props, "strength")
         layout.prop(wind_props, "direction")
         layout.operator("wind.create_wind")
+        layout.prop(wind_props, "cache_path")
+        layout.operator("wind.bake_wind")
+        layout.prop(wind_props, "bake_workers")
+        layout.operator("wind.bake_wind_parallel")
+        layout.prop(wind_props, "use_cache")
 
 class WindGenerator(bpy.types.Operator):
     """
@@ -230,43 +850,91 @@ class WindGenerator(bpy.types.Operator):
         """
         Method that executes grass animation process
         """
-        wind_props = context.scene.wind_props
-
-        bpy.ops.object.effector_add(
-            type='WIND', align='WORLD', enter_editmode=False,
-            location=(0, 0, 1.5), scale=(1, 1, 1), rotation = (-90.0, 0.0, wind_props.direction),
-            radius = 0.15)
-        wind_object = bpy.context.object
-        context.scene.wind_object = wind_object
-
-        bpy.ops.object.effector_add(
-            type='TURBULENCE', enter_editmode=False,
-            align='WORLD', location=(0, 0, 0), scale=(1, 1, 1)
-        )
-        turbulence_object = bpy.context.object
-        context.scene.turbulence_object = turbulence_object
-
-        turbulence_object.animation_data_create()
-        turbulence_object.animation_data.action = bpy.data.actions.new(name="TurbulenceRotation")
-
-        # Turbulence object rotation for grass animation
-        fcurve = turbulence_object.animation_data.action.fcurves.new(data_path="rotation_euler", index=0)
-        fcurve.keyframe_points.add(count=2)
-        fcurve.keyframe_points[0].co = (0, 0)
-        fcurve.keyframe_points[1].co = (250, 9.28)
-        fcurve.update()
-
-        context.scene.frame_start = 1
-        context.scene.frame_end = 250
-        bpy.ops.screen.animation_play()
+        wind_object, turbulence_object = create_wind(context.scene, context.collection, context.view_layer)
+        make_active(context, turbulence_object)
+        if context.screen is not None:  # Playback needs a window, there is none in background mode
+            bpy.ops.screen.animation_play()
 
         self.report({'INFO'}, "Wind and Turbulence Simulation Created!")
         return {'FINISHED'}
 
+class WindBaker(bpy.types.Operator):
+    """
+    Class that handles baking of grass animation into wind cache
+    """
+    bl_label = "Bake wind"
+    bl_idname = "wind.bake_wind"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        """
+        Method that evaluates all frames once, saves them and switches playback to the cache
+        """
+        scene = context.scene
+        if scene.grass_object is None or not scene.grass_object.particle_systems:
+            self.report({'ERROR'}, "Only grass made of hair particles is simulated, instanced blades need no bake")
+            return {'CANCELLED'}
+        wind_props = scene.wind_props
+        frame_current = scene.frame_current
+        cache = bake_wind(scene, context.evaluated_depsgraph_get(), bpy.path.abspath(wind_props.cache_path),
+                          scene.frame_start, scene.frame_end, context.window_manager)
+        use_wind_cache(scene, cache, scene.frame_start, context.collection)
+        scene.frame_set(frame_current)
+
+        self.report({'INFO'}, "Wind baked to %s!" % wind_props.cache_path)
+        return {'FINISHED'}
+
+class WindParallelBaker(bpy.types.Operator):
+    """
+    Class that handles baking of grass animation in background Blender processes
+    """
+    bl_label = "Bake wind in parallel"
+    bl_idname = "wind.bake_wind_parallel"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        """
+        Method that saves copy of the scene, bakes its chunks in worker processes and merges them
+        """
+        scene = context.scene
+        if scene.grass_object is None or not scene.grass_object.particle_systems:
+            self.report({'ERROR'}, "Only grass made of hair particles is simulated, instanced blades need no bake")
+            return {'CANCELLED'}
+        wind_props = scene.wind_props
+        use_cache = wind_props.use_cache
+        show_cache(scene, False)  # Workers simulate grass
+        window_manager = context.window_manager
+        cache = None
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                blend_path = os.path.join(directory, "wind_bake.blend")
+                bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True)  # Workers read the current state
+                chunks = len(split_frames(scene.frame_start, scene.frame_end,
+                                          wind_props.bake_workers or os.cpu_count()))
+                window_manager.progress_begin(0, chunks)
+                try:
+                    cache = bake_wind_parallel(blend_path, scene.frame_start, scene.frame_end,
+                                               bpy.path.abspath(wind_props.cache_path), wind_props.bake_workers,
+                                               window_manager.progress_update)
+                except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                    self.report({'ERROR'}, "Wind bake failed: %s" % e)
+                    return {'CANCELLED'}
+                finally:
+                    window_manager.progress_end()
+        finally:
+            if cache is None:  # Failed bake leaves playback as it was
+                show_cache(scene, use_cache)
+        use_wind_cache(scene, cache, scene.frame_start, context.collection)
+        scene.frame_set(scene.frame_current)
+
+        self.report({'INFO'}, "Wind baked to %s in %d chunks!" % (wind_props.cache_path, chunks))
+        return {'FINISHED'}
+
 # Module initialization:
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-classes = [GrassProps, GrassPanel, GrassGenerator, WindProps, WindPanel, WindGenerator]
+classes = [GrassProps, GrassPanel, GrassGenerator, WindProps, WindPanel, WindGenerator, WindBaker,
+           WindParallelBaker]
 
 def register():
     """
@@ -279,11 +947,18 @@ def register():
     bpy.types.Scene.grass_object = PointerProperty(type=bpy.types.Object)
     bpy.types.Scene.wind_object = PointerProperty(type=bpy.types.Object)
     bpy.types.Scene.turbulence_object = PointerProperty(type=bpy.types.Object)
+    bpy.types.Scene.baked_grass_object = PointerProperty(type=bpy.types.Object)
+    bpy.app.handlers.frame_change_pre.append(play_wind_cache)
 
 def unregister():
     """
     Unregisters all classes and deletes all property
     """
+    if bpy.app.timers.is_registered(apply_updates):
+        bpy.app.timers.unregister(apply_updates)
+    pending_updates.clear()
+    if play_wind_cache in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(play_wind_cache)
     for cls in classes:
         bpy.utils.unregister_class(cls)
     del bpy.types.Scene.grass_props
@@ -291,6 +966,7 @@ def unregister():
     del bpy.types.Scene.wind_props
     del bpy.types.Scene.wind_object
     del bpy.types.Scene.turbulence_object
+    del bpy.types.Scene.baked_grass_object
 
 if __name__ == "__main__":
     register()
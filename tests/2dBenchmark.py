@@ -0,0 +1,251 @@
+#!/usr/bin/python
+"""
+Headless benchmark for GIMP plug-in
+Runs convolution core under plain Python with stand-ins for GIMP modules and drawables.
+"""
+
+import os
+import sys
+import math
+import json
+import time
+import types
+import argparse
+import platform
+
+SIZES = [0.25, 1, 4, 12, 50]  # Image sizes in megapixels
+BPPS = [1, 3, 4]  # Bytes per pixel: GRAY, RGB, RGBA
+KERNELS = ["Sobel", "Roberts", "Prewitt"]
+DISPLAY_TYPES = [0, 1, 2]  # 0: Grayscale, 1: Red and Blue, 2: Thin edges
+THRESHOLD = 0.1  # Allowed slowdown against baseline
+WARM_UP_SIZE = 0.01  # Megapixels of untimed run before the first case
+
+
+class StandInRegion(object):
+    """
+    Stand-in for GIMP pixel region. Supports slicing with drawable coordinates.
+    """
+    def __init__(self, drawable, shadow):
+        self.drawable = drawable
+        self.shadow = shadow
+
+    def buffer(self):
+        """
+        Returns pixels of the drawable or its shadow tiles.
+        """
+        return self.drawable.shadow if self.shadow else self.drawable.pixels
+
+    def __getitem__(self, key):
+        columns, rows = key
+        pixels = self.buffer()
+        rowstride = self.drawable.width * self.drawable.bpp
+        if columns.start == 0 and columns.stop == self.drawable.width:  # Whole rows are contiguous
+            return bytes(pixels[rows.start * rowstride:rows.stop * rowstride])
+        return b''.join([bytes(pixels[y * rowstride + columns.start * self.drawable.bpp:
+                                      y * rowstride + columns.stop * self.drawable.bpp])
+                         for y in range(rows.start, rows.stop)])
+
+    def __setitem__(self, key, value):
+        columns, rows = key
+        pixels = self.buffer()
+        rowstride = self.drawable.width * self.drawable.bpp
+        width = (columns.stop - columns.start) * self.drawable.bpp
+        if columns.start == 0 and columns.stop == self.drawable.width:
+            pixels[rows.start * rowstride:rows.stop * rowstride] = value
+            return
+        for index, y in enumerate(range(rows.start, rows.stop)):
+            start = y * rowstride + columns.start * self.drawable.bpp
+            pixels[start:start + width] = value[index * width:(index + 1) * width]
+
+
+class StandInDrawable(object):
+    """
+    Stand-in for GIMP drawable filled with random pixels.
+    """
+    def __init__(self, width, height, bpp):
+        self.ID = 1
+        self.width = width
+        self.height = height
+        self.bpp = bpp
+        self.has_alpha = bpp in (2, 4)
+        self.offsets = (0, 0)
+        self.mask_bounds = (0, 0, width, height)
+        self.pixels = bytearray(os.urandom(width * height * bpp))
+        self.shadow = bytearray(len(self.pixels))
+
+    def get_pixel_rgn(self, x, y, width, height, dirty=False, shadow=False):
+        return StandInRegion(self, shadow)
+
+    def flush(self):
+        pass
+
+    def merge_shadow(self, undo):
+        self.pixels[:] = self.shadow
+
+    def update(self, x, y, width, height):
+        pass
+
+
+def install_stand_ins():
+    """
+    Registers stand-ins for GIMP and GTK modules, so the plug-in can be imported without GIMP.
+    """
+    names = ["gimp", "gimpplugin", "gtk", "gobject", "gimpui", "gimpcolor", "pango",
+             "gimpenums", "gimpshelf", "gimpfu"]
+    for name in names:
+        sys.modules[name] = types.ModuleType(name)
+
+    gimp = sys.modules["gimp"]
+    gimp.pdb = types.ModuleType("pdb")
+    gimp.directory = os.path.join(os.path.expanduser("~"), ".gimp-benchmark")
+    gimp.main = lambda *args: None
+    gimp.progress_init = lambda *args: None
+    gimp.progress_update = lambda *args: None
+    gimp.displays_flush = lambda: None
+    gimp.tile_width = lambda: 64
+    gimp.tile_height = lambda: 64
+    gimp.message = lambda *args: None
+
+    class Plugin(object):
+        pass
+    sys.modules["gimpplugin"].plugin = Plugin
+    sys.modules["gobject"].idle_add = lambda function, *args: function(*args)
+    sys.modules["gobject"].threads_init = lambda: None
+    sys.modules["gimpshelf"].shelf = {}
+
+    gimpfu = sys.modules["gimpfu"]
+    for index, name in enumerate(["PDB_INT32", "PDB_STRING", "PDB_IMAGE", "PDB_DRAWABLE", "PLUGIN"]):
+        setattr(gimpfu, name, index)
+    gimpfu.RUN_INTERACTIVE, gimpfu.RUN_NONINTERACTIVE, gimpfu.RUN_WITH_LAST_VALS = 0, 1, 2
+
+
+def load_plugin():
+    """
+    Imports the plug-in module with stand-ins installed.
+    """
+    install_stand_ins()
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "2D"))
+    import Convolution
+    return Convolution
+
+
+def image_size(megapixels):
+    """
+    Returns width and height of 4:3 image with given number of megapixels.
+    """
+    width = int(math.sqrt(megapixels * 1e6 * 4 / 3))
+    return width, int(megapixels * 1e6 / width)
+
+
+def run_case(module, kernel, display_type, megapixels, bpp, repeat, workers):
+    """
+    Measures the best time of full-image convolution for one configuration.
+    """
+    width, height = image_size(megapixels)
+    drawable = StandInDrawable(width, height, bpp)
+    best = None
+    stdout = sys.stdout
+    for _ in range(repeat):
+        plugin = module.ConvolutionPlugin()
+        plugin.drawable = drawable
+        plugin.workers = workers
+        sys.stdout = open(os.devnull, "w")  # Plug-in prints progress messages
+        try:
+            start = time.time()
+            plugin.convolute(kernel, display_type)
+            elapsed = time.time() - start
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        best = elapsed if best is None else min(best, elapsed)
+    return {"kernel": kernel, "display_type": display_type, "megapixels": megapixels, "bpp": bpp,
+            "width": width, "height": height, "seconds": best,
+            "megapixels_per_second": width * height / 1e6 / best if best > 0 else 0.0}
+
+
+def case_key(result):
+    """
+    Returns key identifying configuration of a result.
+    """
+    return "%s/%d/%g/%d" % (result["kernel"], result["display_type"], result["megapixels"], result["bpp"])
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns list of results, that are slower than baseline by more than threshold.
+    """
+    baseline_results = dict((case_key(result), result) for result in baseline["results"] if "error" not in result)
+    regressions = []
+    for result in results:
+        old = baseline_results.get(case_key(result))
+        if old is None or "error" in result:
+            continue
+        if result["megapixels_per_second"] < old["megapixels_per_second"] * (1.0 - threshold):
+            regressions.append((result, old))
+    return regressions
+
+
+def parse_list(text, cast):
+    """
+    Splits comma separated command line value.
+    """
+    return [cast(value) for value in text.split(",") if value]
+
+
+def main():
+    """
+    Main function of the benchmark
+    """
+    parser = argparse.ArgumentParser(description="Headless benchmark of convolution plug-in.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES), help="Megapixels, comma separated")
+    parser.add_argument("--bpp", default=",".join(str(bpp) for bpp in BPPS), help="Bytes per pixel, comma separated")
+    parser.add_argument("--kernels", default=",".join(KERNELS), help="Kernels, comma separated")
+    parser.add_argument("--display-types", default=",".join(str(display_type) for display_type in DISPLAY_TYPES),
+                        help="Display types, comma separated")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of every configuration, best one is kept")
+    parser.add_argument("--workers", type=int, default=0, help="Worker threads (0 uses all CPUs)")
+    parser.add_argument("--output", default="2dBenchmark.json", help="Path of JSON results")
+    parser.add_argument("--baseline", help="Path of JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Allowed slowdown (0.1 is 10 %%)")
+    args = parser.parse_args()
+
+    module = load_plugin()
+    import convolution_core  # Next to the plug-in, its directory is on the path since load_plugin
+    numpy = convolution_core.load_numpy()  # Imported before timing, the first case would include it otherwise
+    run_case(module, KERNELS[0], DISPLAY_TYPES[0], WARM_UP_SIZE, BPPS[0], 1, args.workers)  # Untimed warm-up run
+    results = []
+    for megapixels in parse_list(args.sizes, float):
+        for bpp in parse_list(args.bpp, int):
+            for kernel in parse_list(args.kernels, str):
+                for display_type in parse_list(args.display_types, int):
+                    try:
+                        result = run_case(module, kernel, display_type, megapixels, bpp, args.repeat, args.workers)
+                        print("%-8s display %d %6g MP bpp %d: %8.3f s %8.2f MP/s"
+                              % (kernel, display_type, megapixels, bpp, result["seconds"],
+                                 result["megapixels_per_second"]))
+                    except Exception as e:
+                        result = {"kernel": kernel, "display_type": display_type, "megapixels": megapixels,
+                                  "bpp": bpp, "error": repr(e)}
+                        print("%-8s display %d %6g MP bpp %d: failed %r" % (kernel, display_type, megapixels, bpp, e))
+                    results.append(result)
+
+    report = {"python": platform.python_version(),
+              "numpy": numpy.__version__ if numpy is not None else None,
+              "machine": platform.machine(),
+              "results": results}
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print("Results saved to %s" % args.output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for result, old in regressions:
+            print("Regression %s: %.2f MP/s, baseline %.2f MP/s"
+                  % (case_key(result), result["megapixels_per_second"], old["megapixels_per_second"]))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against %s" % args.baseline)
+
+if __name__ == "__main__":
+    main()
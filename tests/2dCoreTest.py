@@ -0,0 +1,118 @@
+#!/usr/bin/python
+"""
+CLI test for convolution core without GIMP
+Detects edges in generated images with the command line and compares them with results computed in memory.
+Committed PNG with all filter types is decoded and its edges are compared with fixed values.
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "2D"))
+import convolution_core
+
+WIDTH, HEIGHT = 200, 150  # Size of generated images
+INPUT_IMAGE = "CoreSrc.ppm"  # Name of the generated input image in temporary directory
+OUTPUT_IMAGES = ["CoreEdit.png", "CoreEdit.ppm"]  # Names of the output images in temporary directory
+KERNEL_METHODS = {7: "direct", 15: "direct", 21: "fft"}  # Methods of random N x N kernels, FFT pays off above 20x20
+SEPARABLE_KERNELS = ["Sobel", "Prewitt", "Scharr", "Sobel 5x5", "Sobel 7x7"]  # Applied as two 1D passes with NumPy
+FILTERS_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "CoreFilters.png")  # Rows use filters 0-4
+FILTERS_SIZE = 24, 20  # Size of the committed PNG
+FILTERS_EDGES = {0: "60fed6f30dc370f60faed8adc3000733",  # MD5 of Sobel edges of the committed PNG by display type
+                 2: "7c3d0fe2f47d7ca77ca7137aa001f070"}
+IMPORT_LIMIT = 0.5  # Seconds, the core is imported by a new process without GIMP and NumPy
+
+def filters_pixels(width, height):
+    """
+    Returns pixels of the committed PNG, they are computed by the same formula as when it was encoded
+    """
+    return bytes(bytearray(value for y in range(height) for x in range(width)
+                           for value in ((x * x * 7 + y * 13) % 256, (x * y * 3 + y * y * 5) % 256,
+                                         ((x ^ y) * 29 + x * 11) % 256)))
+
+def test_convolution_core():
+    """
+    Main function for testing the command line of convolution core
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        failures = check_convolution_core(directory)
+    finally:
+        shutil.rmtree(directory)
+    if failures:
+        sys.exit(1)
+    print("Core test completed.")
+
+def check_convolution_core(directory):
+    """
+    Runs the checks with images in given directory. Returns number of failures
+    """
+    generator = random.Random(1)
+    pixels = bytes(bytearray(generator.randrange(256) for _ in range(WIDTH * HEIGHT * 3)))
+    input_image = os.path.join(directory, INPUT_IMAGE)
+    output_images = [os.path.join(directory, output_image) for output_image in OUTPUT_IMAGES]
+    with open(input_image, "wb") as image_file:
+        image_file.write(b"P6\n%d %d\n255\n" % (WIDTH, HEIGHT) + pixels)
+
+    failures = 0
+    for kernel in ["Sobel", "Roberts", "Prewitt", "Laplacian of Gaussian"]:
+        for display_type in [0, 1, 2]:  # 0: Grayscale, 1: Red and Blue, 2: Thin edges
+            core = convolution_core.ConvolutionCore()
+            expected = bytes(core.compute_pixels(kernel, display_type, pixels, WIDTH, HEIGHT, 3))
+            for output_image in output_images:
+                convolution_core.main([input_image, output_image, "--kernel", kernel,
+                                       "--display", str(display_type), "--band-height", "16"])
+                result = b"".join(convolution_core.open_image(output_image).rows())
+                if result != expected:
+                    failures += 1
+                    print("Core test failed: %s, display %d, %s" % (kernel, display_type,
+                                                                    os.path.basename(output_image)))
+
+    for magnitude_type in convolution_core.ConvolutionCore.MAGNITUDE_TYPES:  # Integer magnitudes of display type 0
+        core = convolution_core.ConvolutionCore()
+        core.magnitude_type = magnitude_type
+        expected = bytes(core.compute_pixels("Sobel", 0, pixels, WIDTH, HEIGHT, 3))
+        convolution_core.main([input_image, output_images[0], "--magnitude", magnitude_type])
+        if b"".join(convolution_core.open_image(output_images[0]).rows()) != expected:
+            failures += 1
+            print("Core test failed: magnitude %s" % magnitude_type)
+
+    core = convolution_core.ConvolutionCore()
+    for kernel in SEPARABLE_KERNELS:
+        if [core.kernel_method(core.kernels_x[kernel]), core.kernel_method(core.kernels_y[kernel])] != ["separable"] * 2:
+            failures += 1
+            print("Core test failed: %s is not separated" % kernel)
+    for size, method in sorted(KERNEL_METHODS.items()):
+        kernel = [[generator.randrange(-3, 4) for _ in range(size)] for _ in range(size)]
+        kernel[0][0], kernel[0][1], kernel[1][0], kernel[1][1] = 1, 0, 0, 1  # Not separable
+        if core.kernel_method(kernel) != method:
+            failures += 1
+            print("Core test failed: %dx%d kernel is not applied with %s" % (size, size, method))
+
+    if b"".join(convolution_core.open_image(FILTERS_IMAGE).rows()) != filters_pixels(*FILTERS_SIZE):
+        failures += 1
+        print("Core test failed: PNG filters")
+    for display_type, checksum in sorted(FILTERS_EDGES.items()):
+        convolution_core.main([FILTERS_IMAGE, output_images[1], "--display", str(display_type), "--band-height", "8"])
+        result = b"".join(convolution_core.open_image(output_images[1]).rows())
+        if hashlib.md5(result).hexdigest() != checksum:
+            failures += 1
+            print("Core test failed: edges of PNG filters, display %d" % display_type)
+
+    start = time.time()
+    subprocess.check_call([sys.executable, "-c", "import convolution_core"],
+                          cwd=os.path.dirname(os.path.abspath(convolution_core.__file__)))
+    elapsed = time.time() - start
+    if elapsed > IMPORT_LIMIT:
+        failures += 1
+        print("Core test failed: start up took %.3f s" % elapsed)
+    return failures
+
+if __name__ == "__main__":
+    test_convolution_core()
@@ -8,6 +8,9 @@ from gimpfu import pdb
 
 INPUT_IMAGE = "LenaSrc.jpg"  # Path to the input image
 OUTPUT_IMAGE = "LenaEdit.jpg"  # Path to the output image
+OUTPUT_SELECTION_IMAGE = "LenaSelection.jpg"  # Path to the output image of selection test
+OUTPUT_LAYERS_IMAGE = "LenaLayers.xcf"  # Path to the output image of layers test
+OUTPUT_DIR = "batch"  # Directory for output images of batch test
 
 def test_convolution_plugin():
     """
@@ -17,8 +20,8 @@ def test_convolution_plugin():
         image = pdb.gimp_file_load(INPUT_IMAGE, INPUT_IMAGE)
         drawable = pdb.gimp_image_get_active_drawable(image)
 
-        kernel_type = "Sobel"  # Options: "Sobel", "Roberts", "Prewitt"
-        display_type = 0  # 0: Grayscale, 1: Red and Blue
+        kernel_type = "Sobel"  # Options: "Sobel", "Roberts", "Prewitt", "Scharr", "Sobel 5x5", "Sobel 7x7", ...
+        display_type = 0  # 0: Grayscale, 1: Red and Blue, 2: Thin edges
 
         pdb.convolution_main(
             run_mode=1,  # RUN_INTERACTIVE: 0, RUN_NONINTERACTIVE: 1, RUN_WITH_LAST_VALS: 2
@@ -26,6 +29,14 @@ def test_convolution_plugin():
             drawable=drawable,
             p_kernel_type=kernel_type,
             p_display_type=display_type,
+            p_workers=0,  # 0: Use all CPUs
+            p_luma_type="Average",  # Options: "Average", "Rec601", "Rec709"
+            p_kernel_spec="",  # Custom kernel for p_kernel_type "Custom", e.g. "1 0 -1; 2 0 -2; 1 0 -1"
+            p_cache=0,  # 1: Reuse results cached on disk for unchanged drawables
+            p_edge_blur=1,  # Blur radius for display type 2 (thin edges)
+            p_edge_low=40,  # Gradient magnitude of weak edges for display type 2
+            p_edge_high=100,  # Gradient magnitude of strong edges for display type 2
+            p_magnitude_type="Exact",  # Options: "Exact", "L1", "Alpha max beta min" for display type 0
         )
 
         # Save the resulting image
@@ -40,5 +51,92 @@ def test_convolution_plugin():
         if 'image' in locals():
             pdb.gimp_image_delete(image)
 
+def test_convolution_batch():
+    """
+    Function for testing the batch procedure of convolution plugin
+    """
+    try:
+        pdb.convolution_batch(
+            run_mode=1,  # RUN_NONINTERACTIVE
+            p_input_glob=INPUT_IMAGE,
+            p_output_dir=OUTPUT_DIR,
+            p_kernel_type="Prewitt",
+            p_display_type=1,
+        )
+
+        print("Batch test completed. Output saved.")
+
+    except Exception as e:
+        print("Batch test failed with error.")
+
+def test_convolution_selection():
+    """
+    Function for testing the convolution plugin with elliptical selection
+    """
+    try:
+        image = pdb.gimp_file_load(INPUT_IMAGE, INPUT_IMAGE)
+        drawable = pdb.gimp_image_get_active_drawable(image)
+        pdb.gimp_image_select_ellipse(image, 2, image.width // 4, image.height // 4,  # 2: CHANNEL_OP_REPLACE
+                                      image.width // 2, image.height // 2)
+
+        pdb.convolution_main(
+            run_mode=1,  # RUN_NONINTERACTIVE
+            image=image,
+            drawable=drawable,
+            p_kernel_type="Sobel",
+            p_display_type=0,
+            p_workers=0,
+            p_luma_type="Average",
+            p_kernel_spec="",
+            p_cache=0,
+            p_edge_blur=1,
+            p_edge_low=40,
+            p_edge_high=100,
+            p_magnitude_type="Exact",
+        )
+
+        pdb.file_jpeg_save(image, drawable, OUTPUT_SELECTION_IMAGE, OUTPUT_SELECTION_IMAGE,
+                           0.9, 0, 0, 0, "", 0, 0, 0, 0)
+
+        print("Selection test completed. Output saved.")
+
+    except Exception as e:
+        print("Selection test failed with error.")
+    finally:
+        if 'image' in locals():
+            pdb.gimp_image_delete(image)
+
+def test_convolution_layers():
+    """
+    Function for testing the convolution plugin on all layers of the image
+    """
+    try:
+        image = pdb.gimp_file_load(INPUT_IMAGE, INPUT_IMAGE)
+        drawable = pdb.gimp_image_get_active_drawable(image)
+        for _ in range(3):  # Frames of animation
+            pdb.gimp_image_insert_layer(image, pdb.gimp_layer_copy(drawable, True), None, 0)
+
+        pdb.convolution_layers(
+            run_mode=1,  # RUN_NONINTERACTIVE
+            image=image,
+            p_kernel_type="Sobel",
+            p_display_type=0,
+            p_first_layer=0,
+            p_last_layer=-1,  # -1: The bottom layer
+        )
+
+        pdb.gimp_xcf_save(0, image, drawable, OUTPUT_LAYERS_IMAGE, OUTPUT_LAYERS_IMAGE)  # XCF keeps all layers
+
+        print("Layers test completed. Output saved.")
+
+    except Exception as e:
+        print("Layers test failed with error.")
+    finally:
+        if 'image' in locals():
+            pdb.gimp_image_delete(image)
+
 if __name__ == "__main__":
     test_convolution_plugin()
+    test_convolution_batch()
+    test_convolution_selection()
+    test_convolution_layers()
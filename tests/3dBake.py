@@ -0,0 +1,43 @@
+"""
+CLI for parallel wind baking of Blender plug-in
+Splits frame range of a saved scene into chunks, bakes them in blender --background workers and merges them.
+Usage: blender --background scene.blend --python 3dBake.py -- [--workers N] [--start F] [--end F] [--save]
+"""
+
+import sys
+import time
+import argparse
+import bpy
+
+def main():
+    """
+    Main function of the parallel bake
+    """
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    scene = bpy.context.scene
+    parser = argparse.ArgumentParser(prog="3dBake.py", description="Bakes wind of grass in parallel.")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (0 uses all CPUs)")
+    parser.add_argument("--start", type=int, default=scene.frame_start, help="First frame")
+    parser.add_argument("--end", type=int, default=scene.frame_end, help="Last frame")
+    parser.add_argument("--output", default=scene.wind_props.cache_path, help="Path of wind cache")
+    parser.add_argument("--save", action="store_true", help="Play grass from the cache and save the scene")
+    args = parser.parse_args(argv)
+    if args.end < args.start:
+        parser.error(f"--end {args.end} is before --start {args.start}")
+
+    if not bpy.data.filepath:
+        print("ERROR: Scene must be saved, workers load it from the file.")
+        sys.exit(1)
+    import grass
+    start_time = time.time()
+    cache = grass.bake_wind_parallel(bpy.data.filepath, args.start, args.end, bpy.path.abspath(args.output),
+                                     args.workers, lambda count: print(f"INFO: {count} chunks baked."))
+    print(f"INFO: Frames {args.start}-{args.end} baked to {args.output} in {time.time() - start_time:.1f} s.")
+    if args.save:
+        scene.wind_props.cache_path = args.output
+        grass.use_wind_cache(scene, cache, args.start)
+        bpy.ops.wm.save_mainfile()
+        print("INFO: Scene saved with wind cache.")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@
 Testing for GIMP plug-in
 """
 
+import os
+import tempfile
 import bpy
 
 def test_grass_plugin():
@@ -49,6 +51,42 @@ def test_grass_plugin():
     print(f"INFO: Wind strength set to {wind_props.strength}.")
     print(f"INFO: Wind direction set to {wind_props.direction}.")
 
+    try:
+        scene = bpy.context.scene
+        scene.frame_end = 5  # Short range keeps the test fast
+        wind_props.cache_path = os.path.join(tempfile.gettempdir(), "wind_cache.npy")
+        bpy.ops.wind.bake_wind()
+        assert wind_props.use_cache and scene.baked_grass_object is not None
+        scene.frame_set(3)  # Test playback from the cache
+        wind_props.use_cache = False
+        print("INFO: Wind baked successfully.")
+    except Exception as e:
+        print(f"ERROR: Failed to bake wind. {e}")
+        return
+
+    try:
+        import grass
+        objects = len(bpy.data.objects)
+        fields = grass.create_grass_fields(bpy.context.scene, [(x * 2.0, y * 2.0, 0) for x in range(10) for y in range(10)])
+        assert len(fields) == 100 and len(bpy.data.objects) == objects + 100
+        print("INFO: 100 grass fields created in one call.")
+    except Exception as e:
+        print(f"ERROR: Failed to create grass fields. {e}")
+        return
+
+    try:
+        grass_props.backend = 'GEOMETRY_NODES'
+        bpy.ops.grass.generate_grass()
+        grass_props.blades = 1000000  # Test instanced blades
+        assert bpy.context.scene.grass_object.modifiers.get(grass.BLADES_MODIFIER) is not None
+        node_group = grass.blades_node_group(bpy.context.scene.grass_object)
+        assert abs(node_group.nodes["Wind Strength"].outputs[0].default_value - wind_props.strength) < 1e-6  # Existing wind
+        bpy.context.scene.frame_set(10)
+        print(f"INFO: Geometry Nodes grass with {grass_props.blades} blades created successfully.")
+    except Exception as e:
+        print(f"ERROR: Failed to create Geometry Nodes grass. {e}")
+        return
+
     print("INFO: All tests passed.")
 
 # Run the test